@@ -1,2 +1,4 @@
 __author__ = 'Gjum'
-__all__ = ['buffer', 'client', 'gcommer', 'utils', 'vec', 'world']
+# aio is left out, it needs Python 3.5.2+
+__all__ = ['buffer', 'capture', 'client', 'columnar', 'farm', 'gcommer',
+           'pool', 'protocol', 'transport', 'utils', 'vec', 'world', 'wsframe']
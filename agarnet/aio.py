@@ -0,0 +1,206 @@
+"""
+`Client` running on asyncio, so many connections and other coroutines
+can share one event loop.
+"""
+import asyncio
+
+from .client import Client
+from .wsframe import FrameDecoder, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG, \
+    check_handshake_response, encode_frame, handshake_request
+
+
+class AsyncWebSocket(object):
+    """
+    Websocket connection over asyncio streams.
+
+    `send()` and `close()` only buffer the data and return immediately,
+    `recv()` is a coroutine.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.decoder = FrameDecoder()
+        self.connected = True
+
+    @classmethod
+    async def open(cls, address, origin=None):
+        """
+        Connects to the address and does the websocket handshake.
+
+        :param address: string, `IP:PORT`
+        """
+        host, port = address.rsplit(':', 1)
+        reader, writer = await asyncio.open_connection(host, int(port))
+        request, key = handshake_request(address, origin=origin)
+        writer.write(request)
+        try:
+            response = await reader.readuntil(b'\r\n\r\n')
+            check_handshake_response(response, key)
+        except Exception:
+            writer.close()
+            raise
+        return cls(reader, writer)
+
+    def send(self, packet):
+        """Buffers the packet for sending, does not block."""
+        self.writer.write(encode_frame(packet))
+
+    async def recv(self):
+        """
+        Returns the next received message (`bytes`).
+
+        Answers pings, and raises `ConnectionError`
+        when the connection got closed.
+        """
+        decoder = self.decoder
+        while True:
+            message = decoder.next_message()
+            if message is None:
+                data = await self.reader.read(1 << 16)
+                if not data:
+                    self.close()
+                    raise ConnectionError('Connection closed')
+                decoder.feed(data)
+                continue
+            opcode, payload = message
+            if opcode == OPCODE_PING:
+                self.writer.write(encode_frame(payload, OPCODE_PONG))
+            elif opcode == OPCODE_CLOSE:
+                self.close()
+                raise ConnectionError('Connection closed by server')
+            elif opcode != OPCODE_PONG:
+                return payload
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            try:
+                self.writer.write(encode_frame(b'', OPCODE_CLOSE))
+            except Exception:
+                pass  # already closed by the server
+            self.writer.close()
+
+
+class UnconnectedTransport(object):
+    """
+    Placeholder `AsyncClient.transport` until `connect()` opens a transport.
+    """
+    connected = False
+
+    def send(self, packet):
+        raise ConnectionError('Not connected')
+
+    async def recv(self):
+        raise ConnectionError('Not connected')
+
+    def close(self):
+        pass
+
+
+class AsyncClient(Client):
+    """
+    Like `Client`, but connects and receives using asyncio.
+
+    Parsing, the `player` and `world` state and the subscriber events
+    are the same as in `Client`. The `send_*()` methods only buffer
+    the packets and return immediately.
+
+    Iterating over it with `async for` receives and parses the packets
+    until it gets disconnected, yielding the packet names.
+    """
+
+    def __init__(self, subscriber, open_transport=AsyncWebSocket.open):
+        """
+        :param subscriber: class instance that implements any on_*() methods
+        :param open_transport: coroutine function that takes the address
+            and `origin` keyword argument, and returns a connected
+            transport like `AsyncWebSocket`
+        """
+        # The transport connected to the server,
+        # an `UnconnectedTransport` before connecting.
+        super(AsyncClient, self).__init__(subscriber, UnconnectedTransport())
+
+        # Opens `transport` when connecting.
+        self.open_transport = open_transport
+
+    async def connect(self, address, token=None, timeout=None):
+        """
+        Coroutine, like `Client.connect()`.
+
+        :param timeout: seconds to wait for the connection,
+                        `None` to wait until it succeeds or fails
+        """
+        if self.connected:
+            self.subscriber.on_connect_error(
+                'Already connected to "%s"' % self.address)
+            return False
+
+        self.address = address
+        self.server_token = token
+        self.ingame = False
+
+        try:
+            self.transport = await asyncio.wait_for(
+                self.open_transport(address, origin='http://agar.io'),
+                timeout)
+        except Exception as e:
+            self.subscriber.on_connect_error(
+                'Failed to connect to "%s": %s' % (self.address, e))
+            return False
+
+        self.subscriber.on_sock_open()
+        # allow handshake canceling
+        if not self.connected:
+            self.subscriber.on_connect_error(
+                'Disconnected before sending handshake')
+            return False
+
+        self.send_handshake()
+        if self.server_token:
+            self.send_token(self.server_token)
+
+        old_nick = self.player.nick
+        self.player.reset()
+        self.world.reset()
+        self.player.nick = old_nick
+        return True
+
+    async def receive(self):
+        """
+        Coroutine, like `Client.receive()`.
+        """
+        try:
+            return await self.transport.recv()
+        except Exception as e:
+            self.subscriber.on_message_error(
+                'Error while receiving packet: %s' % str(e))
+            self.disconnect()
+            return None
+
+    def on_message(self, msg):
+        """
+        Parses the received message, see `ProtocolParser.parse()`.
+        """
+        if self.recorder is not None:
+            self.recorder.record_received(msg)
+        return self.parser.parse(msg)
+
+    async def listen(self):
+        """
+        Coroutine, receives and parses packets until disconnected.
+        """
+        while self.connected:
+            msg = await self.receive()
+            if msg is not None:
+                self.on_message(msg)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.connected:
+            msg = await self.receive()
+            if msg is not None:
+                return self.on_message(msg)
+        raise StopAsyncIteration
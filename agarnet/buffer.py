@@ -1,18 +1,116 @@
 # -*- coding: utf-8 -*-
 import struct
+import sys
+from collections import OrderedDict
+
+
+_structs = {}
+
+# Keeps invalid lone surrogates in UTF-16 strings, which the UTF-16 codecs
+# only support since Python 3.4. Replaces them with U+FFFD before that.
+utf16_errors = 'surrogatepass' if sys.version_info >= (3, 4) else 'replace'
+
+
+def get_struct(fmt):
+    """Returns a cached, precompiled `struct.Struct` for `fmt`."""
+    try:
+        return _structs[fmt]
+    except KeyError:
+        if len(_structs) >= 256:  # formats with varying counts
+            _structs.clear()
+        st = _structs[fmt] = struct.Struct(fmt)
+        return st
 
 
 class BufferUnderflowError(struct.error):
     def __init__(self, fmt, buf):
         self.fmt = fmt
-        self.buf = buf
+        self.buf = buf = bytes(buf)
         self.args = ('Buffer too short: wanted %i %s, got %i %s'
                      % (struct.calcsize(fmt), fmt, len(buf), buf),)
 
 
+class StringCache(object):
+    """
+    Bounded LRU cache mapping raw string bytes to decoded, interned strings.
+
+    Names and skin URLs repeat in every packet, so decoding them once
+    and sharing the `str` instance saves time and memory.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._strings = OrderedDict()
+
+    def __len__(self):
+        return len(self._strings)
+
+    def clear(self):
+        """Removes all strings and resets the counters."""
+        self._strings.clear()
+        self.hits = self.misses = 0
+
+    def decode(self, raw, encoding, errors='strict'):
+        """
+        Returns the string for the raw bytes `raw` (bytes or memoryview),
+        decoding and caching it if it is not cached yet.
+        """
+        key = (encoding, bytes(raw))
+        strings = self._strings
+        try:
+            text = strings[key]
+        except KeyError:
+            self.misses += 1
+            text = strings[key] = sys.intern(str(raw, encoding, errors))
+            if len(strings) > self.maxsize:
+                strings.popitem(last=False)
+        else:
+            self.hits += 1
+            strings.move_to_end(key)
+        return text
+
+
 class BufferStruct(object):
-    def __init__(self, message):
-        self.buffer = message
+    """
+    Reads values from a binary message.
+
+    Keeps a read offset into a `memoryview` of the message,
+    so popping values never copies the remaining payload.
+    """
+
+    def __init__(self, message, string_cache=None):
+        """
+        :param message: bytes-like object to read from
+        :param string_cache: optional StringCache used by pop_str*()
+        """
+        self.string_cache = string_cache
+        if not isinstance(message, (bytes, bytearray)):
+            message = bytes(message)
+        # `bytes.find()` is used to scan for string terminators
+        self.data = message
+        self.message = memoryview(message)
+        self.offset = 0
+
+    @property
+    def buffer(self):
+        """The unread part of the message, as a `memoryview`."""
+        return self.message[self.offset:]
+
+    @property
+    def remaining(self):
+        """Number of unread bytes."""
+        return len(self.message) - self.offset
+
+    def __len__(self):
+        return self.remaining
+
+    def skip(self, size):
+        """Advances the read offset by `size` bytes without reading them."""
+        if self.remaining < size:
+            raise BufferUnderflowError('<%ix' % size, self.buffer)
+        self.offset += size
 
     def __str__(self):
         specials = {
@@ -41,12 +139,25 @@ class BufferStruct(object):
         return ''.join(nice_bytes)
 
     def pop_values(self, fmt):
-        size = struct.calcsize(fmt)
-        if len(self.buffer) < size:
-            raise BufferUnderflowError(fmt, self.buffer)
-        values = struct.unpack_from(fmt, self.buffer, 0)
-        self.buffer = self.buffer[size:]
-        return values
+        return self.pop_struct(get_struct(fmt))
+
+    def pop_struct(self, st):
+        """
+        Unpacks the values of the precompiled `struct.Struct` `st`
+        at the current offset and advances past them.
+        """
+        offset = self.offset
+        if len(self.message) - offset < st.size:
+            raise BufferUnderflowError(st.format, self.buffer)
+        self.offset = offset + st.size
+        return st.unpack_from(self.message, offset)
+
+    def pop_many(self, fmt, count):
+        """
+        Unpacks `count` consecutive little-endian values of
+        the single-character format `fmt`, like `'I'`, in one call.
+        """
+        return self.pop_values('<%i%s' % (count, fmt)) if count else ()
 
     def pop_int8(self):
         return self.pop_values('<b')[0]
@@ -73,19 +184,33 @@ class BufferStruct(object):
         return self.pop_values('<d')[0]
 
     def pop_str16(self):
-        l_name = []
-        while 1:
-            c = self.pop_uint16()
-            if c == 0:
-                break
-            l_name.append(chr(c))
-        return ''.join(l_name)
+        """
+        Pops a null-terminated UTF-16 (little-endian) string.
+        """
+        data, start = self.data, self.offset
+        end = data.find(b'\0\0', start)
+        while end != -1 and (end - start) % 2:  # terminator is not aligned
+            end = data.find(b'\0\0', end + 1)
+        if end == -1:
+            raise BufferUnderflowError('<H', self.buffer)
+        self.offset = end + 2
+        return self.decode(start, end, 'utf-16-le', utf16_errors)
 
     def pop_str8(self):
-        l_name = []
-        while 1:
-            c = self.pop_uint8()
-            if c == 0:
-                break
-            l_name.append(chr(c))
-        return ''.join(l_name)
+        """
+        Pops a null-terminated UTF-8 string.
+        """
+        data, start = self.data, self.offset
+        end = data.find(b'\0', start)
+        if end == -1:
+            raise BufferUnderflowError('<B', self.buffer)
+        self.offset = end + 1
+        return self.decode(start, end, 'utf-8', 'replace')
+
+    def decode(self, start, end, encoding, errors='strict'):
+        raw = self.message[start:end]
+        if not raw:
+            return ''
+        if self.string_cache is None:
+            return str(raw, encoding, errors)
+        return self.string_cache.decode(raw, encoding, errors)
@@ -0,0 +1,207 @@
+"""
+Compact binary capture files of the packets sent and received by a client.
+
+A capture starts with a header: the magic bytes `AGCAP`, the format
+version (1 byte), the flags (1 byte, `FLAG_ZLIB`) and the wall clock
+time of the recording start (little endian double).
+
+The records are only ever appended. Each one is its direction
+(1 byte, `RECEIVED` or `SENT`), the seconds since the recording start
+(double, from the monotonic clock), the packet length (4 bytes),
+and the packet itself.
+
+The records are written in blocks, each prefixed with its length
+(4 bytes). With `FLAG_ZLIB` each block is compressed on its own,
+and also prefixed with its uncompressed length (4 bytes),
+so the complete blocks of a truncated capture can still be read.
+"""
+import struct
+import time
+import zlib
+from collections import namedtuple
+
+RECEIVED = 0
+SENT = 1
+
+FLAG_ZLIB = 1
+
+capture_magic = b'AGCAP'
+capture_version = 1
+
+header_struct = struct.Struct('<5sBBd')
+record_struct = struct.Struct('<BdI')
+block_struct = struct.Struct('<I')
+
+Record = namedtuple('Record', 'time direction packet')
+
+
+class CaptureError(Exception):
+    """The file is not a capture, or it is damaged."""
+
+
+class CaptureWriter(object):
+    """
+    Appends records to a capture file.
+
+    The records are buffered in memory and only written once
+    `block_size` bytes are collected, or on `flush()` and `close()`.
+    Can be used as a context manager, which closes it.
+    """
+
+    def __init__(self, file, compress=False, block_size=1 << 16,
+                 level=zlib.Z_DEFAULT_COMPRESSION, clock=time.monotonic):
+        """
+        :param file: path, or binary file object opened for writing
+        :param compress: compress each block with zlib
+        :param block_size: bytes of records collected before writing them
+        :param level: zlib compression level
+        :param clock: returns the current time in seconds,
+                      for the record timestamps
+        """
+        if isinstance(file, (str, bytes)):
+            file = open(file, 'wb')
+            self.owns_file = True
+        else:
+            self.owns_file = False
+        self.file = file
+        self.compress = compress
+        self.block_size = block_size
+        self.level = level
+        self.clock = clock
+        self.start = clock()
+        self.buffer = bytearray()
+        # number of records written so far
+        self.records = 0
+        flags = FLAG_ZLIB if compress else 0
+        file.write(header_struct.pack(capture_magic, capture_version,
+                                      flags, time.time()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, direction, packet):
+        """Adds one packet (`bytes`) sent or received right now."""
+        buf = self.buffer
+        buf += record_struct.pack(direction, self.clock() - self.start,
+                                  len(packet))
+        buf += packet
+        self.records += 1
+        if len(buf) >= self.block_size:
+            self._write_block()
+
+    def record_received(self, packet):
+        """Used by `Client.on_message()`."""
+        self.record(RECEIVED, packet)
+
+    def record_sent(self, packet):
+        """Used by `Client.send_raw()` if `record_sent` is enabled."""
+        self.record(SENT, packet)
+
+    def _write_block(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        if self.compress:
+            compressed = zlib.compress(data, self.level)
+            self.file.write(block_struct.pack(len(compressed)) +
+                            block_struct.pack(len(data)) + compressed)
+        else:
+            self.file.write(block_struct.pack(len(data)) + data)
+
+    def flush(self):
+        """Writes the buffered records and flushes the file."""
+        if self.buffer:
+            self._write_block()
+        self.file.flush()
+
+    def close(self):
+        """Writes the buffered records, and closes the file if it opened it."""
+        if self.file is None:
+            return
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+        self.file = None
+
+
+class CaptureReader(object):
+    """
+    Reads the records of a capture file.
+
+    Iterating over it yields `Record(time, direction, packet)` tuples.
+    An incomplete block at the end, left by a crashed recorder, is ignored.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: path, or binary file object opened for reading
+        """
+        if isinstance(file, (str, bytes)):
+            file = open(file, 'rb')
+            self.owns_file = True
+        else:
+            self.owns_file = False
+        self.file = file
+        header = file.read(header_struct.size)
+        if len(header) < header_struct.size:
+            raise CaptureError('Incomplete header')
+        magic, self.version, self.flags, self.start_time = \
+            header_struct.unpack(header)
+        if magic != capture_magic:
+            raise CaptureError('Not a capture file')
+        if self.version != capture_version:
+            raise CaptureError('Unsupported version %i' % self.version)
+
+    @property
+    def compressed(self):
+        return bool(self.flags & FLAG_ZLIB)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        for block in self.blocks():
+            pos = 0
+            while pos < len(block):
+                direction, timestamp, length = \
+                    record_struct.unpack_from(block, pos)
+                pos += record_struct.size
+                yield Record(timestamp, direction, block[pos:pos + length])
+                pos += length
+
+    def blocks(self):
+        """Yields the uncompressed blocks of records (`bytes`)."""
+        read = self.file.read
+        size = block_struct.size
+        while True:
+            prefix = read(size * 2 if self.compressed else size)
+            if len(prefix) < size:
+                return
+            length, = block_struct.unpack_from(prefix)
+            data = read(length)
+            if self.compressed:
+                if len(prefix) < size * 2 or len(data) < length:
+                    return
+                raw_length, = block_struct.unpack_from(prefix, size)
+                data = zlib.decompress(data)
+                if len(data) != raw_length:
+                    raise CaptureError('Damaged block')
+            elif len(data) < length:
+                return
+            yield data
+
+    def packets(self, direction=RECEIVED):
+        """Yields the packets in one direction, for example
+        to replay the received ones with a `MemoryTransport`."""
+        for record in self:
+            if record.direction == direction:
+                yield record.packet
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
@@ -1,59 +1,36 @@
 import struct
+import warnings
 
-import websocket
-
-from .buffer import BufferStruct, BufferUnderflowError
-from .vec import Vec
-from .world import Player
-
-packet_s2c = {
-    16: 'world_update',
-    17: 'spectate_update',
-    18: 'clear_cells',  # TODO which cells?
-    20: 'clear_cells',
-    21: 'debug_line',
-    32: 'own_id',
-    49: 'leaderboard_names',
-    50: 'leaderboard_groups',
-    64: 'world_rect',
-    81: 'experience_info',
-}
-
-packet_c2s = {
-    0: 'respawn',
-    1: 'spectate',
-    16: 'target',
-    17: 'split',
-    18: 'spectate_toggle',
-    20: 'explode',
-    21: 'shoot',
-    80: 'token',
-    81: 'facebook',
-    254: 'handshake1',
-    255: 'handshake2',
-}
-
-ingame_packets = ('world_rect', 'world_update', 'leaderboard_names',
-                  'leaderboard_groups', 'spectate_update', 'own_id')
-
-
-handshake_version = 154669603
+from .protocol import ProtocolEncoder, ProtocolParser
+from .protocol import handshake_version, ingame_packets  # noqa
+from .protocol import packet_c2s, packet_s2c  # noqa
+from .transport import WebSocketClientTransport, default_transport
 
 
 class Client(object):
-    """Talks to a server and calls handlers on events."""
+    """
+    Talks to a server and calls handlers on events.
 
-    def __init__(self, subscriber):
+    The packets are parsed and built by a `ProtocolParser`
+    and a `ProtocolEncoder`, this only moves them over the `transport`.
+    """
+
+    def __init__(self, subscriber, transport=None):
         """
         :param subscriber: class instance that implements any on_*() methods
+        :param transport: see `agarnet.transport`, defaults to
+                          `transport.default_transport()`
         """
-        self.subscriber = subscriber
+        # Parses the received packets and updates `player` and `world`.
+        self.parser = ProtocolParser(subscriber)
 
-        # Gets updated with the new data when the server sends a packet.
-        self.player = Player()
+        # Builds the packets to send.
+        self.encoder = ProtocolEncoder()
 
-        # The websocket instance used to connect to the server.
-        self.ws = websocket.WebSocket()
+        # Moves the packets to and from the server.
+        if transport is None:
+            transport = default_transport()
+        self.transport = transport
 
         # The most recent address used to connect to the server.
         self.address = ''
@@ -64,9 +41,28 @@ class Client(object):
         # The most recent Facebook token sent to a server.
         self.facebook_token = ''
 
-        # `False` after connection, gets set to `True` when
-        # receiving a packet listed in `ingame_packets`.
-        self.ingame = False
+        # Records the received packets if set,
+        # see `agarnet.capture.CaptureWriter`.
+        self.recorder = None
+
+        # Whether the `recorder` also records the sent packets.
+        self.record_sent = False
+
+    @property
+    def subscriber(self):
+        return self.parser.subscriber
+
+    @subscriber.setter
+    def subscriber(self, subscriber):
+        self.parser.subscriber = subscriber
+
+    @property
+    def player(self):
+        return self.parser.player
+
+    @player.setter
+    def player(self, player):
+        self.parser.player = player
 
     @property
     def world(self):
@@ -76,13 +72,40 @@ class Client(object):
     def world(self, world):
         self.player.world = world
 
+    @property
+    def ingame(self):
+        return self.parser.ingame
+
+    @ingame.setter
+    def ingame(self, ingame):
+        self.parser.ingame = ingame
+
+    @property
+    def string_cache(self):
+        return self.parser.string_cache
+
+    @property
+    def ws(self):
+        """
+        The `websocket.WebSocket` of a `WebSocketClientTransport`,
+        for backwards compatibility.
+
+        Deprecated: with other transports, this is the transport itself,
+        which has no `websocket.WebSocket` methods. Use `transport` instead.
+        """
+        if isinstance(self.transport, WebSocketClientTransport):
+            return self.transport.ws
+        warnings.warn('Client.ws is deprecated, use Client.transport',
+                      DeprecationWarning, stacklevel=2)
+        return self.transport
+
     @property
     def connected(self):
-        return self.ws.connected
+        return self.transport.connected
 
     def connect(self, address, token=None):
         """
-        Connect the underlying websocket to the address,
+        Connect the transport to the address,
         send a handshake and optionally a token packet.
 
         Returns `True` if connected, `False` if the connection failed.
@@ -101,8 +124,8 @@ class Client(object):
         self.server_token = token
         self.ingame = False
 
-        self.ws.settimeout(1)
-        self.ws.connect('ws://%s' % self.address, origin='http://agar.io')
+        self.transport.connect('ws://%s' % self.address,
+                               origin='http://agar.io', timeout=1)
         if not self.connected:
             self.subscriber.on_connect_error(
                 'Failed to connect to "%s"' % self.address)
@@ -129,9 +152,10 @@ class Client(object):
         """
         Disconnect from server.
 
-        Closes the websocket, sets `ingame = False`, and emits on_sock_closed.
+        Closes the transport, sets `ingame = False`,
+        and emits on_sock_closed.
         """
-        self.ws.close()
+        self.transport.close()
         self.ingame = False
         self.subscriber.on_sock_closed()
         # keep player/world data
@@ -142,10 +166,18 @@ class Client(object):
 
         After calling `connect()`, this waits for messages from the server
         using `select`, and notifies the subscriber of any events.
+        Transports without `fileno()`, like `MemoryTransport`,
+        are disconnected once they have no pending packets left.
         """
         import select
+        waitable = hasattr(self.transport, 'fileno')
         while self.connected:
-            r, w, e = select.select((self.ws.sock, ), (), ())
+            if self.transport.pending():
+                self.on_message()
+                continue
+            if not waitable:
+                break  # nothing pending and nothing to wait for
+            r, w, e = select.select((self.transport, ), (), ())
             if r:
                 self.on_message()
             elif e:
@@ -154,7 +186,7 @@ class Client(object):
 
     def on_message(self, msg=None):
         """
-        Poll the websocket for a new packet.
+        Receive a new packet from the transport and parse it.
 
         `Client.listen()` calls this.
 
@@ -162,211 +194,44 @@ class Client(object):
             instead of receiving a packet from the socket.
         """
         if msg is None:
-            try:
-                msg = self.ws.recv()
-            except Exception as e:
-                self.subscriber.on_message_error(
-                    'Error while receiving packet: %s' % str(e))
-                self.disconnect()
+            msg = self.receive()
+            if msg is None:
                 return False
 
-        if not msg:
-            self.subscriber.on_message_error('Empty message received')
-            return False
+        if self.recorder is not None:
+            self.recorder.record_received(msg)
+        return self.parser.parse(msg)
 
-        buf = BufferStruct(msg)
-        opcode = buf.pop_uint8()
-        try:
-            packet_name = packet_s2c[opcode]
-        except KeyError:
-            self.subscriber.on_message_error('Unknown packet %s' % opcode)
-            return False
-
-        if not self.ingame and packet_name in ingame_packets:
-            self.subscriber.on_ingame()
-            self.ingame = True
+    def receive(self):
+        """
+        Receives one packet from the transport, without parsing it.
 
-        parser = getattr(self, 'parse_%s' % packet_name)
+        Returns the packet, or `None` if receiving failed,
+        in which case it emits on_message_error and disconnects.
+        """
         try:
-            parser(buf)
-        except BufferUnderflowError as e:
-            msg = 'Parsing %s packet failed: %s' % (packet_name, e.args[0])
-            self.subscriber.on_message_error(msg)
-
-        if len(buf.buffer) != 0:
-            msg = 'Buffer not empty after parsing "%s" packet' % packet_name
-            self.subscriber.on_message_error(msg)
-
-        return packet_name
-
-    def parse_world_update(self, buf):
-        self.subscriber.on_world_update_pre()
-
-        self.parse_cell_eating(buf)
-        self.parse_cell_updates(buf)
-        self.parse_cell_deletions(buf)
-
-        if self.player.is_alive:
-            self.player.cells_changed()
-
-        self.subscriber.on_world_update_post()
-
-    def parse_cell_eating(self, buf):
-        for i in range(buf.pop_uint16()):
-            # ca eats cb
-            ca = buf.pop_uint32()
-            cb = buf.pop_uint32()
-            self.subscriber.on_cell_eaten(eater_id=ca, eaten_id=cb)
-            if cb in self.player.own_ids:  # we got eaten
-                if len(self.player.own_ids) <= 1:
-                    self.subscriber.on_death()
-                    # do not clear all cells yet, they still get updated
-                self.player.own_ids.remove(cb)
-            if cb in self.player.world.cells:
-                self.subscriber.on_cell_removed(cid=cb)
-                del self.player.world.cells[cb]
-
-    def parse_cell_updates(self, buf):
-        # create/update cells
-        while 1:
-            cid = buf.pop_uint32()
-            if cid == 0:
-                break
-            cx = buf.pop_int32()
-            cy = buf.pop_int32()
-            csize = buf.pop_int16()
-            color = (buf.pop_uint8(), buf.pop_uint8(), buf.pop_uint8())
-
-            bitmask = buf.pop_uint8()
-            is_virus = bool(bitmask & 1)
-            is_agitated = bool(bitmask & 16)
-            if bitmask & 2:  # skip padding
-                for i in range(buf.pop_uint32()):
-                    buf.pop_uint8()
-            if bitmask & 4:  # skin URL
-                skin_url = buf.pop_str8()
-            else:  # no skin URL given
-                skin_url = ''
-
-            cname = buf.pop_str16()
-            self.subscriber.on_cell_info(
-                cid=cid, x=cx, y=cy, size=csize, name=cname, color=color,
-                is_virus=is_virus, is_agitated=is_agitated)
-            if cid not in self.player.world.cells:
-                self.world.create_cell(cid)
-            self.player.world.cells[cid].update(
-                cid=cid, x=cx, y=cy, size=csize, name=cname, color=color,
-                is_virus=is_virus, is_agitated=is_agitated)
-
-            if skin_url:  # TODO Cell.update() and on_cell_info got too bulky
-                self.subscriber.on_cell_skin(skin_url=skin_url)
-
-    def parse_cell_deletions(self, buf):
-        cells = self.player.world.cells
-        # also keep these non-updated cells
-        for i in range(buf.pop_uint32()):
-            cid = buf.pop_uint32()
-            if cid in cells:
-                self.subscriber.on_cell_removed(cid=cid)
-                del cells[cid]
-                if cid in self.player.own_ids:  # own cells joined
-                    self.player.own_ids.remove(cid)
-
-    def parse_leaderboard_names(self, buf):
-        # sent every 500ms
-        # not in "teams" mode
-        n = buf.pop_uint32()
-        leaderboard_names = []
-        for i in range(n):
-            l_id = buf.pop_uint32()
-            l_name = buf.pop_str16()
-            leaderboard_names.append((l_id, l_name))
-        self.subscriber.on_leaderboard_names(leaderboard=leaderboard_names)
-        self.player.world.leaderboard_names = leaderboard_names
-
-    def parse_leaderboard_groups(self, buf):
-        # sent every 500ms
-        # only in "teams" mode
-        n = buf.pop_uint32()
-        leaderboard_groups = []
-        for i in range(n):
-            angle = buf.pop_float32()
-            leaderboard_groups.append(angle)
-        self.subscriber.on_leaderboard_groups(angles=leaderboard_groups)
-        self.player.world.leaderboard_groups = leaderboard_groups
-
-    def parse_own_id(self, buf):  # new cell ID, respawned or split
-        cid = buf.pop_uint32()
-        if not self.player.is_alive:  # respawned
-            self.player.own_ids.clear()
-            self.subscriber.on_respawn()
-        # server sends empty name, assumes we set it here
-        if cid not in self.world.cells:
-            self.world.create_cell(cid)
-        # self.world.cells[cid].name = self.player.nick
-        self.player.own_ids.add(cid)
-        self.player.cells_changed()
-        self.subscriber.on_own_id(cid=cid)
-
-    def parse_world_rect(self, buf):  # world size
-        left = buf.pop_float64()
-        top = buf.pop_float64()
-        right = buf.pop_float64()
-        bottom = buf.pop_float64()
-        self.subscriber.on_world_rect(
-            left=left, top=top, right=right, bottom=bottom)
-        self.world.top_left = Vec(top, left)
-        self.world.bottom_right = Vec(bottom, right)
-
-        if buf.buffer:
-            number = buf.pop_uint32()
-            text = buf.pop_str16()
-            self.subscriber.on_server_version(number=number, text=text)
-
-    def parse_spectate_update(self, buf):
-        # only in spectate mode
-        x = buf.pop_float32()
-        y = buf.pop_float32()
-        scale = buf.pop_float32()
-        self.player.center.set(x, y)
-        self.player.scale = scale
-        self.subscriber.on_spectate_update(
-            pos=self.player.center, scale=scale)
-
-    def parse_experience_info(self, buf):
-        level = buf.pop_uint32()
-        current_xp = buf.pop_uint32()
-        next_xp = buf.pop_uint32()
-        self.subscriber.on_experience_info(
-            level=level, current_xp=current_xp, next_xp=next_xp)
-
-    def parse_clear_cells(self, buf):
-        # TODO clear cells packet is untested
-        self.subscriber.on_clear_cells()
-        self.world.cells.clear()
-        self.player.own_ids.clear()
-        self.player.cells_changed()
-
-    def parse_debug_line(self, buf):
-        # TODO debug line packet is untested
-        x = buf.pop_int16()
-        y = buf.pop_int16()
-        self.subscriber.on_debug_line(x=x, y=y)
-
-    # format reminder
-    # b int8
-    # h int16
-    # i int32
-    # f float32
-    # d float64
+            return self.transport.recv()
+        except Exception as e:
+            self.subscriber.on_message_error(
+                'Error while receiving packet: %s' % str(e))
+            self.disconnect()
+            return None
 
     def send_struct(self, fmt, *data):
         """
         If connected, formats the data to a struct and sends it to the server.
+        """
+        self.send_raw(struct.pack(fmt, *data))
+
+    def send_raw(self, packet):
+        """
+        If connected, sends the packet (`bytes`) to the server.
         Used internally by all other `send_*()` methods.
         """
         if self.connected:
-            self.ws.send(struct.pack(fmt, *data))
+            self.transport.send(packet)
+            if self.record_sent and self.recorder is not None:
+                self.recorder.record_sent(packet)
 
     def send_handshake(self):
         """
@@ -376,8 +241,8 @@ class Client(object):
         Has to be sent before any other packets,
         or the server will drop the connection when receiving any other packet.
         """
-        self.send_struct('<BI', 254, 5)
-        self.send_struct('<BI', 255, handshake_version)
+        for packet in self.encoder.handshake():
+            self.send_raw(packet)
 
     def send_token(self, token):
         """
@@ -388,7 +253,7 @@ class Client(object):
         acquired through `utils.find_server()`, otherwise the server will
         drop the connection when receiving any other packet.
         """
-        self.send_struct('<B%iB' % len(token), 80, *map(ord, token))
+        self.send_raw(self.encoder.token(token))
         self.server_token = token
 
     def send_facebook(self, token):
@@ -400,15 +265,14 @@ class Client(object):
 
         Seems to be broken in recent versions of the game.
         """
-        self.send_struct('<B%iB' % len(token), 81, *map(ord, token))
+        self.send_raw(self.encoder.facebook(token))
         self.facebook_token = token
 
     def send_respawn(self):
         """
         Respawns the player.
         """
-        nick = self.player.nick
-        self.send_struct('<B%iH' % len(nick), 0, *map(ord, nick))
+        self.send_raw(self.encoder.respawn(self.player.nick))
 
     def send_target(self, x, y, cid=0):
         """
@@ -424,7 +288,7 @@ class Client(object):
 
         Same as moving your mouse in the original client.
         """
-        self.send_struct('<BiiI', 16, int(x), int(y), cid)
+        self.send_raw(self.encoder.target(x, y, cid))
 
     def send_spectate(self):
         """
@@ -433,14 +297,14 @@ class Client(object):
         The server then starts sending `spectate_update` packets
         containing the center and size of the spectated area.
         """
-        self.send_struct('<B', 1)
+        self.send_raw(self.encoder.spectate())
 
     def send_spectate_toggle(self):
         """
         Toggles the spectate mode between following the largest player
         and moving around freely.
         """
-        self.send_struct('<B', 18)
+        self.send_raw(self.encoder.spectate_toggle())
 
     def send_split(self):
         """
@@ -448,7 +312,7 @@ class Client(object):
 
         Same as pressing `Space` in the original client.
         """
-        self.send_struct('<B', 17)
+        self.send_raw(self.encoder.split())
 
     def send_shoot(self):
         """
@@ -456,14 +320,14 @@ class Client(object):
 
         Same as pressing `W` in the original client.
         """
-        self.send_struct('<B', 21)
+        self.send_raw(self.encoder.shoot())
 
     def send_explode(self):
         """
         In earlier versions of the game, sending this caused your cells
         to split into lots of small cells and die.
         """
-        self.send_struct('<B', 20)
+        self.send_raw(self.encoder.explode())
         self.player.own_ids.clear()
         self.player.cells_changed()
         self.ingame = False
@@ -0,0 +1,243 @@
+"""
+Column-oriented (structure-of-arrays) cell storage.
+
+Keeps the data of all cells in typed arrays instead of one object per cell,
+which needs much less memory and allows vectorized queries over all cells.
+Uses NumPy arrays if available, `array.array` otherwise.
+"""
+from array import array
+from collections.abc import MutableMapping
+
+from .vec import Vec, VecArray
+from .world import Cell, World
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# name, `array` typecode, NumPy dtype
+cell_columns = (
+    ('cid', 'I', 'uint32'),
+    ('x', 'd', 'float64'),
+    ('y', 'd', 'float64'),
+    ('size', 'd', 'float64'),
+    ('mass', 'd', 'float64'),
+    ('flags', 'B', 'uint8'),  # bit 1: virus, bit 16: agitated
+    ('r', 'B', 'uint8'),
+    ('g', 'B', 'uint8'),
+    ('b', 'B', 'uint8'),
+)
+
+VIRUS = 1
+AGITATED = 16
+
+
+class CellView(Cell):
+    """
+    `Cell`-like view of one row in a `CellColumns` store.
+
+    Reading and writing its attributes reads and writes the store.
+    `pos` returns a new `Vec` each time, so assign it instead of
+    modifying it in place.
+    """
+    __slots__ = ('store',)
+
+    def __init__(self, store, cid):
+        self.store = store
+        self.cid = cid
+
+    def _get(self, column):
+        store = self.store
+        return store.data[column][store.rows[self.cid]]
+
+    def update(self, cid=-1, x=0, y=0, size=0, name='',
+               color=(1, 0, 1), is_virus=False, is_agitated=False):
+        self.store.set_row(self.cid, x, y, size, name, color,
+                           is_virus, is_agitated)
+
+    @property
+    def pos(self):
+        return Vec(self._get('x'), self._get('y'))
+
+    @pos.setter
+    def pos(self, pos):
+        store = self.store
+        row = store.rows[self.cid]
+        store.data['x'][row], store.data['y'][row] = pos
+
+    @property
+    def size(self):
+        return self._get('size')
+
+    @property
+    def mass(self):
+        return self._get('mass')
+
+    @property
+    def name(self):
+        return self.store.names[self.store.rows[self.cid]]
+
+    @property
+    def color(self):
+        return (self._get('r') / 255.0, self._get('g') / 255.0,
+                self._get('b') / 255.0)
+
+    @property
+    def is_virus(self):
+        return bool(self._get('flags') & VIRUS)
+
+    @property
+    def is_agitated(self):
+        return bool(self._get('flags') & AGITATED)
+
+
+class CellColumns(MutableMapping):
+    """
+    Maps cell IDs to `CellView`s, keeping the cell data in typed arrays.
+
+    `rows` maps the IDs to their row in the arrays.
+    Removing a cell moves the last row into its place.
+    """
+
+    def __init__(self, use_numpy=None, capacity=256):
+        """
+        :param use_numpy: `True` to use NumPy arrays, `False` to use
+                          `array.array`, `None` to use NumPy if available
+        :param capacity: initial number of rows when using NumPy
+        """
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self.use_numpy = use_numpy
+        self.capacity = capacity
+        self.rows = {}
+        self.names = []
+        self.data = {}
+        self.clear()
+
+    def clear(self):
+        self.rows.clear()
+        self.names.clear()
+        if self.use_numpy:
+            self.data = {name: numpy.zeros(self.capacity, dtype)
+                         for name, typecode, dtype in cell_columns}
+        else:
+            self.data = {name: array(typecode)
+                         for name, typecode, dtype in cell_columns}
+
+    def column(self, name):
+        """
+        Returns the values of all cells in the column `name`,
+        ordered by row, without copying them.
+        """
+        values = self.data[name]
+        if self.use_numpy:
+            return values[:len(self.rows)]
+        return values
+
+    def add(self, cid):
+        """Appends a row for the cell with default values."""
+        row = len(self.rows)
+        data = self.data
+        if self.use_numpy:
+            if row >= len(data['cid']):  # double the capacity
+                for name, values in data.items():
+                    data[name] = numpy.concatenate(
+                        (values, numpy.zeros_like(values)))
+            for name, typecode, dtype in cell_columns:
+                data[name][row] = 0
+        else:
+            for name, typecode, dtype in cell_columns:
+                data[name].append(0)
+        data['cid'][row] = cid
+        self.names.append('')
+        self.rows[cid] = row
+
+    def set_row(self, cid, x, y, size, name, color, is_virus, is_agitated):
+        """Updates the cell like `Cell.update()`."""
+        row = self.rows[cid]
+        data = self.data
+        data['x'][row] = x
+        data['y'][row] = y
+        data['size'][row] = size
+        data['mass'][row] = size ** 2 / 100.0
+        data['flags'][row] = (is_virus and VIRUS) | (is_agitated and AGITATED)
+        data['r'][row], data['g'][row], data['b'][row] = color
+        if not self.names[row]:
+            self.names[row] = name
+
+    def __getitem__(self, cid):
+        if cid not in self.rows:
+            raise KeyError(cid)
+        return CellView(self, cid)
+
+    def __setitem__(self, cid, cell):
+        if cid not in self.rows:
+            self.add(cid)
+        x, y = cell.pos
+        self.set_row(cid, x, y, cell.size, cell.name,
+                     tuple(int(round(c * 255)) for c in cell.color),
+                     cell.is_virus, cell.is_agitated)
+
+    def __delitem__(self, cid):
+        row = self.rows.pop(cid)
+        last = len(self.rows)
+        names = self.names
+        if row != last:  # move the last row into the gap
+            for values in self.data.values():
+                values[row] = values[last]
+            names[row] = names[last]
+            self.rows[int(self.data['cid'][row])] = row
+        names.pop()
+        if not self.use_numpy:
+            for values in self.data.values():
+                values.pop()
+
+    def __contains__(self, cid):
+        return cid in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class ColumnarWorld(World):
+    """
+    `World` that keeps its cells in a `CellColumns` store.
+
+    `cells[cid]` returns a `CellView`, so `cell_class` and
+    the cell `pool` are not used.
+    """
+    cell_class = CellView
+
+    def __init__(self, use_numpy=None):
+        super(ColumnarWorld, self).__init__()
+        self.cells = CellColumns(use_numpy)
+
+    pool_size = 0
+
+    def create_cell(self, cid):
+        self.cells.add(cid)
+
+    def positions(self, use_numpy=None):
+        """
+        Returns `(cids, positions)` like `World.positions()`,
+        as views on the columns, without copying them.
+
+        The views are only valid until the next cell gets added or removed.
+        """
+        cells = self.cells
+        if use_numpy is None:
+            use_numpy = cells.use_numpy
+        return cells.column('cid'), VecArray(
+            cells.column('x'), cells.column('y'), use_numpy)
+
+    def update_cell(self, cid, x, y, size, name, color, is_virus, is_agitated):
+        cells = self.cells
+        if cid not in cells.rows:
+            self.create_cell(cid)
+        cells.set_row(cid, x, y, size, name, color, is_virus, is_agitated)
+        if self.indexes:
+            self.cell_updated(CellView(cells, cid))
@@ -0,0 +1,254 @@
+"""
+Runs many clients in several worker processes,
+so parsing is not limited to one CPU core by the GIL.
+
+Each worker process runs its clients in a `ClientPool`,
+and regularly reports its stats to the parent process.
+"""
+import multiprocessing
+import queue
+import time
+
+from .client import Client
+from .pool import ClientPool
+
+
+def worker_main(index, generation, commands, results, subscriber_factory,
+                report_interval):
+    """
+    Runs in the worker process until it receives a `stop` command.
+
+    Receives `('add', (address, token))` and `('stop', None)` commands,
+    and puts `('stats', index, generation, stats)` into `results`.
+    """
+    pool = ClientPool()
+    added = 0
+    next_report = time.monotonic()
+    running = True
+    while running:
+        while commands.poll():
+            command, args = commands.recv()
+            if command == 'add':
+                address, token = args
+                client = Client(subscriber_factory())
+                added += 1
+                try:
+                    if client.connect(address, token):
+                        pool.add(client)
+                except Exception:
+                    pass  # counts as dead
+            elif command == 'stop':
+                running = False
+        if running:
+            if pool:
+                pool.poll(min(report_interval, 0.05))
+            else:
+                commands.poll(min(report_interval, 0.05))
+        if not running or time.monotonic() >= next_report:
+            next_report = time.monotonic() + report_interval
+            total = pool.total
+            results.put(('stats', index, generation, {
+                'time': time.monotonic(),
+                'clients': added,
+                'alive': len(pool),
+                'dead': added - len(pool),
+                'packets': total.packets,
+                'bytes': total.bytes,
+                'parse_time': total.parse_time,
+            }))
+    for client in pool:
+        pool.remove(client)
+        client.disconnect()
+
+
+class WorkerHandle(object):
+    """
+    The parent's view of one worker process.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        # incremented on each restart, to ignore stats of crashed processes
+        self.generation = 0
+        self.process = None
+        self.commands = None
+        # (address, token) of all clients assigned to this worker
+        self.clients = []
+        # latest stats reported by the worker
+        self.stats = {}
+        # between the last two reports: fraction of the time spent parsing,
+        # and received packets per second
+        self.parse_load = 0.0
+        self.packet_rate = 0.0
+
+    def report(self, stats):
+        old = self.stats
+        if old and stats['time'] > old['time']:
+            elapsed = stats['time'] - old['time']
+            self.parse_load = \
+                (stats['parse_time'] - old['parse_time']) / elapsed
+            self.packet_rate = (stats['packets'] - old['packets']) / elapsed
+        self.stats = stats
+
+    def reset(self):
+        """Forgets the stats, after the process crashed."""
+        self.generation += 1
+        self.stats = {}
+        self.parse_load = self.packet_rate = 0.0
+
+    @property
+    def unreported(self):
+        """Number of clients assigned after the latest report."""
+        return len(self.clients) - self.stats.get('clients', 0)
+
+
+class Farm(object):
+    """
+    Spreads clients over a number of worker processes.
+
+    New clients are assigned to the worker with the lowest parse load.
+    The load is only balanced when assigning: clients are never moved
+    to another worker later, even if their load changes.
+    Workers that crashed are restarted, and their clients reconnected.
+    """
+
+    def __init__(self, subscriber_factory, processes=None,
+                 report_interval=1.0):
+        """
+        :param subscriber_factory: picklable function that returns
+                                   a new subscriber for each client
+        :param processes: number of worker processes,
+                          defaults to the number of CPUs
+        :param report_interval: seconds between the stats reports
+                                of each worker
+        """
+        self.subscriber_factory = subscriber_factory
+        self.report_interval = report_interval
+        self.results = multiprocessing.Queue()
+        self.workers = [WorkerHandle(i) for i in
+                        range(processes or multiprocessing.cpu_count())]
+        # number of workers restarted after crashing
+        self.restarts = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Starts all worker processes."""
+        for worker in self.workers:
+            self._start_worker(worker)
+
+    def _start_worker(self, worker):
+        parent_end, child_end = multiprocessing.Pipe()
+        worker.commands = parent_end
+        worker.process = multiprocessing.Process(
+            target=worker_main, daemon=True,
+            args=(worker.index, worker.generation, child_end, self.results,
+                  self.subscriber_factory, self.report_interval))
+        worker.process.start()
+        child_end.close()
+        for client in worker.clients:
+            worker.commands.send(('add', client))
+
+    def add_client(self, address, token=None):
+        """
+        Assigns a new client to the least loaded worker,
+        which connects it to the address.
+
+        Returns the index of the worker. The client stays in that worker,
+        even if it becomes busier than the others later.
+        """
+        worker = min(self.workers, key=self._expected_load)
+        worker.clients.append((address, token))
+        worker.commands.send(('add', (address, token)))
+        return worker.index
+
+    def _expected_load(self, worker):
+        """
+        The worker's parse load, plus the average load per client
+        for each client it has not reported yet.
+        """
+        reported = sum(w.stats.get('clients', 0) for w in self.workers)
+        total_load = sum(w.parse_load for w in self.workers)
+        per_client = total_load / reported if reported else 0
+        return (worker.parse_load + worker.unreported * per_client,
+                len(worker.clients))
+
+    def poll(self, timeout=0):
+        """
+        Collects the stats reported by the workers
+        for up to `timeout` seconds, and restarts crashed workers.
+        """
+        self._collect(timeout)
+        self.restart_crashed()
+
+    def _collect(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                remaining = max(deadline - time.monotonic(), 0)
+                message = self.results.get(timeout=remaining) \
+                    if remaining else self.results.get_nowait()
+            except queue.Empty:
+                break
+            _, index, generation, stats = message
+            worker = self.workers[index]
+            if generation == worker.generation:
+                worker.report(stats)
+
+    def restart_crashed(self):
+        """
+        Restarts all workers whose process exited,
+        and lets them reconnect their clients.
+        """
+        for worker in self.workers:
+            if worker.process is not None and not worker.process.is_alive():
+                worker.commands.close()
+                worker.reset()
+                self.restarts += 1
+                self._start_worker(worker)
+
+    @property
+    def stats(self):
+        """
+        Combined stats of all workers: numbers of `clients`, `alive`
+        and `dead` clients, received `packets` and `bytes`,
+        `packets_per_second`, `parse_us` per packet, `parse_load`
+        (in CPU cores), and `restarts`.
+        """
+        totals = {key: sum(w.stats.get(key, 0) for w in self.workers)
+                  for key in ('clients', 'alive', 'dead', 'packets',
+                              'bytes', 'parse_time')}
+        packets = totals['packets']
+        totals['packets_per_second'] = sum(w.packet_rate
+                                           for w in self.workers)
+        totals['parse_us'] = \
+            totals['parse_time'] / packets * 1e6 if packets else 0.0
+        totals['parse_load'] = sum(w.parse_load for w in self.workers)
+        totals['restarts'] = self.restarts
+        return totals
+
+    def stop(self, timeout=5):
+        """
+        Stops all workers, disconnecting their clients.
+        """
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.commands.send(('stop', None))
+        deadline = time.monotonic() + timeout
+        running = [w for w in self.workers if w.process is not None]
+        while running and time.monotonic() < deadline:
+            self._collect(0.05)  # workers can only exit when it is drained
+            running = [w for w in running if w.process.is_alive()]
+        for worker in self.workers:
+            if worker.process is not None:
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                worker.process.join()
+                worker.process = None
+                worker.commands.close()
+        self._collect(0)
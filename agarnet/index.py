@@ -0,0 +1,494 @@
+"""
+Indexes that a `World` keeps up to date while cells get updated and removed.
+
+Each index has `update(cell)`, `remove(cid)` and `clear()` methods,
+and keeps its own mapping from cell IDs to where it stored them,
+so it can move or remove a cell without scanning.
+"""
+import heapq
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+
+class SpatialGrid(object):
+    """
+    Uniform grid of square buckets, mapping positions to cell IDs.
+
+    Only cell centers are indexed, so queries find the cells
+    whose center is inside the queried area.
+    """
+
+    def __init__(self, bucket_size=500):
+        """
+        :param bucket_size: width and height of each bucket in world units
+        """
+        self.bucket_size = bucket_size
+        # (column, row) -> set of cell IDs
+        self.buckets = {}
+        # cell ID -> (column, row)
+        self.keys = {}
+        # cell ID -> (x, y)
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, cid):
+        return cid in self.keys
+
+    def clear(self):
+        self.buckets.clear()
+        self.keys.clear()
+        self.positions.clear()
+
+    def key(self, x, y):
+        s = self.bucket_size
+        return int(x // s), int(y // s)
+
+    def update(self, cell):
+        cid = cell.cid
+        x, y = cell.pos
+        self.positions[cid] = (x, y)
+        key = self.key(x, y)
+        old_key = self.keys.get(cid)
+        if key == old_key:
+            return
+        if old_key is not None:
+            self._discard(old_key, cid)
+        self.keys[cid] = key
+        try:
+            self.buckets[key].add(cid)
+        except KeyError:
+            self.buckets[key] = {cid}
+
+    def remove(self, cid):
+        key = self.keys.pop(cid, None)
+        if key is not None:
+            del self.positions[cid]
+            self._discard(key, cid)
+
+    def _discard(self, key, cid):
+        bucket = self.buckets[key]
+        bucket.discard(cid)
+        if not bucket:
+            del self.buckets[key]
+
+    def ids_in_rect(self, left, top, right, bottom):
+        """Yields the IDs of all cells inside the rectangle."""
+        positions = self.positions
+        kl, kt = self.key(left, top)
+        kr, kb = self.key(right, bottom)
+        if (kr - kl + 1) * (kb - kt + 1) > len(self.buckets):
+            # larger than the populated area, check all buckets instead
+            buckets = (bucket for (kx, ky), bucket in self.buckets.items()
+                       if kl <= kx <= kr and kt <= ky <= kb)
+        else:
+            buckets = (self.buckets.get((kx, ky), ())
+                       for kx in range(kl, kr + 1)
+                       for ky in range(kt, kb + 1))
+        for bucket in buckets:
+            for cid in bucket:
+                x, y = positions[cid]
+                if left <= x <= right and top <= y <= bottom:
+                    yield cid
+
+    def ids_within(self, x, y, radius):
+        """Yields the IDs of all cells within `radius` around `x, y`."""
+        positions = self.positions
+        radius_sq = radius * radius
+        for cid in self.ids_in_rect(x - radius, y - radius,
+                                    x + radius, y + radius):
+            cx, cy = positions[cid]
+            if (cx - x) ** 2 + (cy - y) ** 2 <= radius_sq:
+                yield cid
+
+    def ids_outside(self, x, y, distance):
+        """
+        Yields the IDs of all cells further than `distance` from `x, y`.
+
+        Buckets completely outside or inside the distance
+        are taken or skipped as a whole.
+        """
+        positions = self.positions
+        s = self.bucket_size
+        dist_sq = distance * distance
+        for (kx, ky), bucket in self.buckets.items():
+            left, top = kx * s, ky * s
+            right, bottom = left + s, top + s
+            near_x = max(left - x, 0, x - right)
+            near_y = max(top - y, 0, y - bottom)
+            if near_x * near_x + near_y * near_y > dist_sq:
+                for cid in bucket:
+                    yield cid
+                continue
+            far_x = max(x - left, right - x)
+            far_y = max(y - top, bottom - y)
+            if far_x * far_x + far_y * far_y <= dist_sq:
+                continue
+            for cid in bucket:
+                cx, cy = positions[cid]
+                if (cx - x) ** 2 + (cy - y) ** 2 > dist_sq:
+                    yield cid
+
+    def nearest_ids(self, x, y, k=1, accept=None):
+        """
+        Returns the IDs of the `k` cells closest to `x, y`, closest first.
+
+        Searches the buckets in growing rings around the position,
+        and stops when no unvisited bucket can contain a closer cell.
+
+        :param accept: optional function, only cell IDs for which
+                       it returns `True` are considered
+        """
+        if not self.buckets or k < 1:
+            return []
+        positions = self.positions
+        bx, by = self.key(x, y)
+        max_ring = max(max(abs(kx - bx), abs(ky - by))
+                       for kx, ky in self.buckets)
+        found = []  # (distance squared, cid)
+        for ring in range(max_ring + 1):
+            for key in ring_keys(bx, by, ring):
+                for cid in self.buckets.get(key, ()):
+                    if accept is None or accept(cid):
+                        cx, cy = positions[cid]
+                        found.append(((cx - x) ** 2 + (cy - y) ** 2, cid))
+            # cells in the next ring are at least this far away
+            reach = ring * self.bucket_size
+            if len(found) >= k and \
+                    heapq.nsmallest(k, found)[-1][0] <= reach * reach:
+                break
+        return [cid for dist_sq, cid in heapq.nsmallest(k, found)]
+
+
+def ring_keys(bx, by, ring):
+    """Yields the bucket keys at Chebyshev distance `ring` from `bx, by`."""
+    if ring == 0:
+        yield bx, by
+        return
+    for kx in range(bx - ring, bx + ring + 1):
+        yield kx, by - ring
+        yield kx, by + ring
+    for ky in range(by - ring + 1, by + ring):
+        yield bx - ring, ky
+        yield bx + ring, ky
+
+
+class CategoryIndex(object):
+    """
+    Sorts the cell IDs into one set per category:
+    `viruses`, `food`, `ejected` mass, and `player_cells` (everything else).
+    """
+
+    def __init__(self):
+        self.viruses = set()
+        self.food = set()
+        self.ejected = set()
+        self.player_cells = set()
+        # cell ID -> the set it is in
+        self.categories = {}
+
+    def __len__(self):
+        return len(self.categories)
+
+    def __contains__(self, cid):
+        return cid in self.categories
+
+    def clear(self):
+        self.viruses.clear()
+        self.food.clear()
+        self.ejected.clear()
+        self.player_cells.clear()
+        self.categories.clear()
+
+    def category(self, cell):
+        """Returns the set the cell belongs into."""
+        if cell.is_virus:
+            return self.viruses
+        if cell.is_food:
+            return self.food
+        if cell.is_ejected_mass:
+            return self.ejected
+        return self.player_cells
+
+    def update(self, cell):
+        cid = cell.cid
+        category = self.category(cell)
+        old = self.categories.get(cid)
+        if category is not old:
+            if old is not None:
+                old.discard(cid)
+            category.add(cid)
+            self.categories[cid] = category
+
+    def remove(self, cid):
+        category = self.categories.pop(cid, None)
+        if category is not None:
+            category.discard(cid)
+
+
+class PlayerIndex(object):
+    """
+    Groups the player cells by their owner, identified by `(name, color)`
+    like `Cell.same_player()` does.
+
+    Each group is a `CellGroup`, so the aggregates of every player
+    are available without scanning the cells.
+    Food, viruses and ejected mass are not indexed.
+    """
+
+    def __init__(self):
+        # (name, color) -> CellGroup
+        self.groups = {}
+        # cell ID -> (name, color)
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __contains__(self, key):
+        return key in self.groups
+
+    def __getitem__(self, key):
+        return self.groups[key]
+
+    def __iter__(self):
+        return iter(self.groups)
+
+    def clear(self):
+        self.groups.clear()
+        self.keys.clear()
+
+    def group_of(self, cid):
+        """Returns the `CellGroup` containing the cell, or `None`."""
+        key = self.keys.get(cid)
+        if key is None:
+            return None
+        return self.groups[key]
+
+    def update(self, cell):
+        cid = cell.cid
+        if cell.is_virus or cell.is_food or cell.is_ejected_mass:
+            self.remove(cid)
+            return
+        key = (cell.name, cell.color)
+        old_key = self.keys.get(cid)
+        if key != old_key:
+            if old_key is not None:
+                self._discard(old_key, cid)
+            self.keys[cid] = key
+        try:
+            group = self.groups[key]
+        except KeyError:
+            group = self.groups[key] = CellGroup()
+        x, y = cell.pos
+        group.set(cid, x, y, cell.size, cell.mass)
+
+    def remove(self, cid):
+        key = self.keys.pop(cid, None)
+        if key is not None:
+            self._discard(key, cid)
+
+    def _discard(self, key, cid):
+        group = self.groups[key]
+        group.discard(cid)
+        if not group:
+            del self.groups[key]
+
+
+class MassOrder(object):
+    """
+    Keeps the cell IDs sorted by `(mass, cid)`, the order of `Cell.__lt__`.
+
+    Lookups are binary searches; an update only moves the cell
+    if its mass changed.
+    """
+
+    def __init__(self):
+        # sorted list of (mass, cid), lightest first
+        self.entries = []
+        # cell ID -> mass
+        self.masses = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, cid):
+        return cid in self.masses
+
+    def clear(self):
+        del self.entries[:]
+        self.masses.clear()
+
+    def update(self, cell):
+        cid = cell.cid
+        mass = cell.mass
+        old = self.masses.get(cid)
+        if old == mass:
+            return
+        if old is not None:
+            self._discard(old, cid)
+        self.masses[cid] = mass
+        insort(self.entries, (mass, cid))
+
+    def remove(self, cid):
+        mass = self.masses.pop(cid, None)
+        if mass is not None:
+            self._discard(mass, cid)
+
+    def _discard(self, mass, cid):
+        entries = self.entries
+        del entries[bisect_left(entries, (mass, cid))]
+
+    def largest(self, k=1):
+        """Returns the IDs of the `k` heaviest cells, heaviest first."""
+        if k < 1:
+            return []
+        return [cid for mass, cid in reversed(self.entries[-k:])]
+
+    def smaller_than(self, mass):
+        """Returns the IDs of all cells lighter than `mass`, lightest first."""
+        end = bisect_left(self.entries, (mass, -1))
+        return [cid for m, cid in self.entries[:end]]
+
+    def count_smaller(self, mass):
+        """Returns the number of cells lighter than `mass`."""
+        return bisect_left(self.entries, (mass, -1))
+
+    def rank(self, cid):
+        """
+        Returns the number of cells that are heavier than the cell,
+        so the heaviest cell has rank `0`.
+        """
+        pos = bisect_left(self.entries, (self.masses[cid], cid))
+        return len(self.entries) - pos - 1
+
+
+class UpdateTicks(object):
+    """
+    Remembers in which tick each cell was last updated.
+
+    The cell IDs are kept ordered from least to most recently updated,
+    so the stalest cells can be found without scanning all cells.
+    """
+
+    def __init__(self):
+        # Incremented for each `world_update` packet.
+        self.tick = 0
+        # cell ID -> tick of last update, least recently updated first
+        self.ticks = OrderedDict()
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __contains__(self, cid):
+        return cid in self.ticks
+
+    def clear(self):
+        self.ticks.clear()
+
+    def update(self, cell):
+        cid = cell.cid
+        self.ticks[cid] = self.tick
+        self.ticks.move_to_end(cid)
+
+    def remove(self, cid):
+        self.ticks.pop(cid, None)
+
+    def oldest(self):
+        """Yields `(cid, tick)` pairs, least recently updated first."""
+        return iter(self.ticks.items())
+
+
+class CellGroup(object):
+    """
+    Aggregates of a group of cells, updated incrementally.
+
+    Keeps the total size and mass, the sum of the positions,
+    and the bounding box, which is only recalculated when a cell
+    on its edge moved inward or got removed.
+    """
+
+    def __init__(self):
+        # cell ID -> (x, y, size, mass)
+        self.members = {}
+        self.total_size = 0
+        self.total_mass = 0.0
+        self.sum_x = 0
+        self.sum_y = 0
+        # (left, top, right, bottom), `None` if outdated
+        self._bounds = None
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, cid):
+        return cid in self.members
+
+    def clear(self):
+        self.members.clear()
+        self.total_size = 0
+        self.total_mass = 0.0
+        self.sum_x = self.sum_y = 0
+        self._bounds = None
+
+    def set(self, cid, x, y, size, mass):
+        """Adds the cell to the group, or updates it."""
+        old = self.members.get(cid)
+        if old is not None:
+            self._subtract(old)
+        self.members[cid] = (x, y, size, mass)
+        self.total_size += size
+        self.total_mass += mass
+        self.sum_x += x
+        self.sum_y += y
+        bounds = self._bounds
+        if bounds is not None:
+            left, top, right, bottom = bounds
+            self._bounds = (min(left, x), min(top, y),
+                            max(right, x), max(bottom, y))
+        elif old is None and len(self.members) == 1:
+            self._bounds = (x, y, x, y)
+
+    def discard(self, cid):
+        """Removes the cell from the group, if present."""
+        old = self.members.pop(cid, None)
+        if old is not None:
+            if self.members:
+                self._subtract(old)
+            else:  # do not accumulate rounding errors
+                self.clear()
+
+    def _subtract(self, old):
+        x, y, size, mass = old
+        self.total_size -= size
+        self.total_mass -= mass
+        self.sum_x -= x
+        self.sum_y -= y
+        bounds = self._bounds
+        if bounds is not None and (x in (bounds[0], bounds[2])
+                                   or y in (bounds[1], bounds[3])):
+            self._bounds = None  # it was on the edge, recalculate later
+
+    @property
+    def bounds(self):
+        """
+        `(left, top, right, bottom)` of the cell centers,
+        `None` if the group is empty.
+        """
+        if self._bounds is None and self.members:
+            xs = [m[0] for m in self.members.values()]
+            ys = [m[1] for m in self.members.values()]
+            self._bounds = (min(xs), min(ys), max(xs), max(ys))
+        return self._bounds
+
+    @property
+    def center(self):
+        """
+        `(x, y)` center of the bounding box, `None` if the group is empty.
+        """
+        bounds = self.bounds
+        if bounds is None:
+            return None
+        left, top, right, bottom = bounds
+        return (left + right) / 2, (top + bottom) / 2
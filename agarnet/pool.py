@@ -0,0 +1,187 @@
+"""
+Runs many clients in one thread, waiting for all of their sockets at once.
+"""
+import select
+import time
+from collections import namedtuple
+
+try:
+    import selectors
+except ImportError:  # Python 3.3
+    selectors = None
+
+EVENT_READ = selectors.EVENT_READ if selectors else 1
+
+
+class ClientStats(object):
+    """
+    Counts the packets and bytes received by a client,
+    and the time spent parsing them.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.packets = 0
+        self.bytes = 0
+        # seconds spent in `Client.on_message()`
+        self.parse_time = 0.0
+
+    def add(self, size, parse_time):
+        self.packets += 1
+        self.bytes += size
+        self.parse_time += parse_time
+
+    @property
+    def elapsed(self):
+        """Seconds since the stats were created."""
+        return time.monotonic() - self.started
+
+    @property
+    def packets_per_second(self):
+        return self.packets / (self.elapsed or 1e-9)
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / (self.elapsed or 1e-9)
+
+    @property
+    def parse_load(self):
+        """Fraction of the elapsed time spent parsing."""
+        return self.parse_time / (self.elapsed or 1e-9)
+
+
+SelectorKey = namedtuple('SelectorKey', 'fileobj fd events data')
+
+
+class SelectSelector(object):
+    """
+    Minimal replacement of `selectors.DefaultSelector` for reading,
+    using `select.select()`. Used on Python 3.3, which has no `selectors`.
+    """
+
+    def __init__(self):
+        # file object -> SelectorKey
+        self.keys = {}
+
+    def register(self, fileobj, events, data=None):
+        key = self.keys[fileobj] = SelectorKey(fileobj, fileobj.fileno(),
+                                               events, data)
+        return key
+
+    def unregister(self, fileobj):
+        return self.keys.pop(fileobj)
+
+    def select(self, timeout=None):
+        ready, _, _ = select.select(list(self.keys), (), (), timeout)
+        return [(self.keys[fileobj], EVENT_READ) for fileobj in ready]
+
+    def close(self):
+        self.keys.clear()
+
+
+class ClientPool(object):
+    """
+    Waits for packets on the sockets of many connected `Client`s
+    using one `selectors` selector (epoll on Linux), and lets each
+    client parse the packets it received.
+
+    Clients are removed from the pool when they get disconnected.
+    """
+
+    def __init__(self, selector=None):
+        """
+        :param selector: defaults to a new `selectors.DefaultSelector`,
+                         or a `SelectSelector` on Python 3.3
+        """
+        if selector is None:
+            selector = selectors.DefaultSelector() if selectors \
+                else SelectSelector()
+        self.selector = selector
+        # client -> ClientStats
+        self.stats = {}
+        # stats of all clients combined, including removed ones
+        self.total = ClientStats()
+        # client -> registered transport
+        self._transports = {}
+
+    def __len__(self):
+        return len(self.stats)
+
+    def __contains__(self, client):
+        return client in self.stats
+
+    def __iter__(self):
+        return iter(list(self.stats))
+
+    def add(self, client):
+        """
+        Adds a connected client to the pool.
+        """
+        transport = client.transport
+        self.selector.register(transport, EVENT_READ, client)
+        self._transports[client] = transport
+        self.stats[client] = ClientStats()
+
+    def remove(self, client):
+        """
+        Removes the client from the pool, without disconnecting it.
+        """
+        self.selector.unregister(self._transports.pop(client))
+        del self.stats[client]
+
+    def poll(self, timeout=None):
+        """
+        Waits until at least one client can receive a packet, then lets
+        each ready client receive and parse its packets.
+
+        Transports with `read_available()` are read once per call,
+        and only their complete packets are parsed, so a client that
+        received part of a packet does not block the other clients.
+
+        Returns the number of packets received.
+
+        :param timeout: maximum seconds to wait, `None` to wait forever
+        """
+        received = 0
+        for key, events in self.selector.select(timeout):
+            client = key.data
+            transport = key.fileobj
+            if hasattr(transport, 'read_available'):
+                # never wait for the rest of a partially received packet
+                transport.read_available()
+                while client in self.stats and transport.pending():
+                    received += self.receive(client)
+                continue
+            # the transport can have received several packets at once
+            while self.receive(client):
+                received += 1
+                if not (client.connected and client.transport.pending()):
+                    break
+        return received
+
+    def receive(self, client):
+        """
+        Receives and parses one packet, and updates the stats.
+        Removes the client if it got disconnected.
+
+        Returns `True` if a packet was received.
+        """
+        msg = client.receive()
+        if msg is not None:
+            start = time.perf_counter()
+            client.on_message(msg)
+            parse_time = time.perf_counter() - start
+            self.stats[client].add(len(msg), parse_time)
+            self.total.add(len(msg), parse_time)
+        if not client.connected:
+            self.remove(client)
+        return msg is not None
+
+    def run(self, timeout=None):
+        """
+        Polls until all clients are disconnected,
+        or until no packet was received for `timeout` seconds.
+        """
+        while self.stats:
+            if not self.poll(timeout) and timeout is not None:
+                break
@@ -0,0 +1,418 @@
+"""
+Sans-IO implementation of the agar.io protocol.
+
+Parses received packets into events and `World`/`Player` changes,
+and encodes packets for sending, without doing any I/O itself.
+"""
+import struct
+from array import array
+
+from .buffer import BufferStruct, BufferUnderflowError, StringCache
+from .vec import Vec
+from .world import Player
+
+packet_s2c = {
+    16: 'world_update',
+    17: 'spectate_update',
+    18: 'clear_cells',  # TODO which cells?
+    20: 'clear_cells',
+    21: 'debug_line',
+    32: 'own_id',
+    49: 'leaderboard_names',
+    50: 'leaderboard_groups',
+    64: 'world_rect',
+    81: 'experience_info',
+}
+
+packet_c2s = {
+    0: 'respawn',
+    1: 'spectate',
+    16: 'target',
+    17: 'split',
+    18: 'spectate_toggle',
+    20: 'explode',
+    21: 'shoot',
+    80: 'token',
+    81: 'facebook',
+    254: 'handshake1',
+    255: 'handshake2',
+}
+
+ingame_packets = ('world_rect', 'world_update', 'leaderboard_names',
+                  'leaderboard_groups', 'spectate_update', 'own_id')
+
+
+handshake_version = 154669603
+
+# All events emitted by the parser, without the `on_` prefix.
+parser_events = (
+    'message_error', 'ingame',
+    'world_update_pre', 'cell_eaten', 'death', 'cell_info', 'cell_skin',
+    'cell_removed', 'world_update_post',
+    'leaderboard_names', 'leaderboard_groups', 'respawn', 'own_id',
+    'world_rect', 'server_version', 'spectate_update', 'experience_info',
+    'clear_cells', 'debug_line',
+)
+
+# Only emitted if the subscriber lists them in its `subscribed_events`.
+optional_parser_events = ('world_update_batch',)
+
+# precompiled structs for the cell updates in `world_update` packets
+# cell ID, padding length
+uint32_struct = struct.Struct('<I')
+# x, y, size, red, green, blue, flags
+cell_header_struct = struct.Struct('<iihBBBB')
+
+
+class ProtocolParser(object):
+    """
+    Parses received packets, updates the `player` and its `world`,
+    and calls the subscriber's handlers on events.
+    """
+
+    def __init__(self, subscriber, player=None):
+        """
+        :param subscriber: class instance that implements any on_*() methods
+        :param player: Player instance to update, a new one if not given
+        """
+        # Names of the events the subscriber handles, see `subscriber`.
+        self.subscribed_events = frozenset()
+        self.subscriber = subscriber
+
+        # Maps the packet opcodes to their parse_*() methods.
+        self.parsers = {opcode: getattr(self, 'parse_%s' % packet_name)
+                        for opcode, packet_name in packet_s2c.items()}
+
+        # Gets updated with the new data when a packet is parsed.
+        self.player = player or Player()
+
+        # `False` after connection, gets set to `True` when
+        # receiving a packet listed in `ingame_packets`.
+        self.ingame = False
+
+        # Decoded cell names, skin URLs, and leaderboard names,
+        # shared between packets. Its hits/misses help sizing it.
+        self.string_cache = StringCache()
+
+    @property
+    def subscriber(self):
+        return self._subscriber
+
+    @subscriber.setter
+    def subscriber(self, subscriber):
+        """
+        If the subscriber has a `subscribed_events` attribute,
+        only the events named in it (without `on_`) are emitted,
+        otherwise all events are.
+        """
+        self._subscriber = subscriber
+        # do not trigger catch-all __getattr__() handlers
+        events = getattr(subscriber, '__dict__', {}).get(
+            'subscribed_events',
+            getattr(type(subscriber), 'subscribed_events', None))
+        if events is None:
+            events = parser_events
+        self.subscribed_events = frozenset(events)
+
+    def subscribes(self, event):
+        """Returns `True` if the subscriber handles the event."""
+        return event in self.subscribed_events
+
+    def emit(self, event, *args, **kwargs):
+        """Calls the subscriber's handler, if it handles the event."""
+        if event in self.subscribed_events:
+            getattr(self._subscriber, 'on_' + event)(*args, **kwargs)
+
+    @property
+    def world(self):
+        return self.player.world
+
+    @world.setter
+    def world(self, world):
+        self.player.world = world
+
+    def parse(self, msg):
+        """
+        Parses one received packet and notifies the subscriber of any events.
+
+        Returns the packet name, or `False` if it could not be parsed.
+
+        :param msg: bytes-like object, the received packet
+        """
+        if not msg:
+            self.emit('message_error', 'Empty message received')
+            return False
+
+        buf = BufferStruct(msg, self.string_cache)
+        opcode = buf.pop_uint8()
+        try:
+            packet_name = packet_s2c[opcode]
+            parser = self.parsers[opcode]
+        except KeyError:
+            self.emit('message_error', 'Unknown packet %s' % opcode)
+            return False
+
+        if not self.ingame and packet_name in ingame_packets:
+            self.emit('ingame')
+            self.ingame = True
+
+        try:
+            parser(buf)
+        except BufferUnderflowError as e:
+            msg = 'Parsing %s packet failed: %s' % (packet_name, e.args[0])
+            self.emit('message_error', msg)
+
+        if buf.remaining != 0:
+            msg = 'Buffer not empty after parsing "%s" packet' % packet_name
+            self.emit('message_error', msg)
+
+        return packet_name
+
+    def parse_world_update(self, buf):
+        self.emit('world_update_pre')
+
+        self.world.next_tick()
+
+        if self.subscribes('world_update_batch'):
+            updated = {'cids': array('I'), 'xs': array('i'), 'ys': array('i'),
+                       'sizes': array('h'), 'flags': array('B')}
+        else:
+            updated = None
+
+        eaten = self.parse_cell_eating(buf)
+        self.parse_cell_updates(buf, updated)
+        removed = self.parse_cell_deletions(buf)
+
+        if self.world.eviction is not None:
+            stale_ids = self.world.stale_cell_ids(
+                self.player.center, self.player.own_ids)
+            self.remove_cells(stale_ids)
+            removed += tuple(stale_ids)
+
+        if self.player.is_alive:
+            self.player.cells_changed()
+
+        if updated is not None:
+            self.subscriber.on_world_update_batch(
+                eaten=array('I', eaten), removed=array('I', removed),
+                **updated)
+
+        self.emit('world_update_post')
+
+    def parse_cell_eating(self, buf):
+        # pairs of (eater, eaten): ca eats cb
+        ids = buf.pop_many('I', 2 * buf.pop_uint16())
+        if not ids:
+            return ids
+        emit_cell_eaten = self.subscribes('cell_eaten')
+        emit_cell_removed = self.subscribes('cell_removed')
+        own_ids = self.player.own_ids
+        world = self.world
+        cells = world.cells
+        # in packet order, each eaten cell right after its eat event
+        for ca, cb in zip(ids[::2], ids[1::2]):
+            if emit_cell_eaten:
+                self.subscriber.on_cell_eaten(eater_id=ca, eaten_id=cb)
+            if cb in own_ids:  # we got eaten
+                if len(own_ids) <= 1:
+                    self.emit('death')
+                    # do not clear all cells yet, they still get updated
+                own_ids.remove(cb)
+            if cb in cells:
+                if emit_cell_removed:
+                    self.subscriber.on_cell_removed(cid=cb)
+                world.remove_cell(cb)
+        return ids
+
+    def parse_cell_updates(self, buf, updated=None):
+        """
+        Creates and updates the cells.
+
+        If `updated` is given, the cells' IDs, positions, sizes and flags
+        are also appended to its `cids`, `xs`, `ys`, `sizes` and `flags`.
+        """
+        pop_struct = buf.pop_struct
+        update_cell = self.world.update_cell
+        emit_cell_info = self.subscribes('cell_info')
+        emit_cell_skin = self.subscribes('cell_skin')
+        if updated is not None:
+            add_cid = updated['cids'].append
+            add_x = updated['xs'].append
+            add_y = updated['ys'].append
+            add_size = updated['sizes'].append
+            add_flags = updated['flags'].append
+        while 1:
+            cid, = pop_struct(uint32_struct)
+            if cid == 0:
+                break
+            cx, cy, csize, r, g, b, bitmask = pop_struct(cell_header_struct)
+            color = (r, g, b)
+            if updated is not None:
+                add_cid(cid)
+                add_x(cx)
+                add_y(cy)
+                add_size(csize)
+                add_flags(bitmask)
+
+            is_virus = bool(bitmask & 1)
+            is_agitated = bool(bitmask & 16)
+            if bitmask & 2:  # skip padding
+                buf.skip(pop_struct(uint32_struct)[0])
+            if bitmask & 4:  # skin URL
+                skin_url = buf.pop_str8()
+            else:  # no skin URL given
+                skin_url = ''
+
+            cname = buf.pop_str16()
+            if emit_cell_info:
+                self.subscriber.on_cell_info(
+                    cid=cid, x=cx, y=cy, size=csize, name=cname, color=color,
+                    is_virus=is_virus, is_agitated=is_agitated)
+            update_cell(cid, cx, cy, csize, cname, color,
+                        is_virus, is_agitated)
+
+            # TODO Cell.update() and on_cell_info got too bulky
+            if skin_url and emit_cell_skin:
+                self.subscriber.on_cell_skin(skin_url=skin_url)
+
+    def parse_cell_deletions(self, buf):
+        # also keep these non-updated cells
+        deleted_ids = buf.pop_many('I', buf.pop_uint32())
+        if deleted_ids:
+            self.remove_cells(deleted_ids)
+            # own cells joined
+            self.player.own_ids.difference_update(deleted_ids)
+        return deleted_ids
+
+    def remove_cells(self, cids):
+        """Removes the cells from the world if present, in order."""
+        world = self.player.world
+        cells = world.cells
+        emit_cell_removed = self.subscribes('cell_removed')
+        for cid in cids:
+            if cid not in cells:
+                continue
+            if emit_cell_removed:
+                self.subscriber.on_cell_removed(cid=cid)
+            world.remove_cell(cid)
+
+    def parse_leaderboard_names(self, buf):
+        # sent every 500ms
+        # not in "teams" mode
+        n = buf.pop_uint32()
+        leaderboard_names = []
+        for i in range(n):
+            l_id = buf.pop_uint32()
+            l_name = buf.pop_str16()
+            leaderboard_names.append((l_id, l_name))
+        self.emit('leaderboard_names', leaderboard=leaderboard_names)
+        self.player.world.leaderboard_names = leaderboard_names
+
+    def parse_leaderboard_groups(self, buf):
+        # sent every 500ms
+        # only in "teams" mode
+        leaderboard_groups = list(buf.pop_many('f', buf.pop_uint32()))
+        self.emit('leaderboard_groups', angles=leaderboard_groups)
+        self.player.world.leaderboard_groups = leaderboard_groups
+
+    def parse_own_id(self, buf):  # new cell ID, respawned or split
+        cid = buf.pop_uint32()
+        if not self.player.is_alive:  # respawned
+            self.player.own_ids.clear()
+            self.emit('respawn')
+        # server sends empty name, assumes we set it here
+        if cid not in self.world.cells:
+            self.world.create_cell(cid)
+        # self.world.cells[cid].name = self.player.nick
+        self.player.own_ids.add(cid)
+        self.player.cells_changed()
+        self.emit('own_id', cid=cid)
+
+    def parse_world_rect(self, buf):  # world size
+        left = buf.pop_float64()
+        top = buf.pop_float64()
+        right = buf.pop_float64()
+        bottom = buf.pop_float64()
+        self.emit('world_rect', left=left, top=top, right=right, bottom=bottom)
+        self.world.top_left = Vec(top, left)
+        self.world.bottom_right = Vec(bottom, right)
+
+        if buf.remaining:
+            number = buf.pop_uint32()
+            text = buf.pop_str16()
+            self.emit('server_version', number=number, text=text)
+
+    def parse_spectate_update(self, buf):
+        # only in spectate mode
+        x = buf.pop_float32()
+        y = buf.pop_float32()
+        scale = buf.pop_float32()
+        self.player.center.set(x, y)
+        self.player.scale = scale
+        self.emit('spectate_update', pos=self.player.center, scale=scale)
+
+    def parse_experience_info(self, buf):
+        level = buf.pop_uint32()
+        current_xp = buf.pop_uint32()
+        next_xp = buf.pop_uint32()
+        self.emit('experience_info', level=level,
+                  current_xp=current_xp, next_xp=next_xp)
+
+    def parse_clear_cells(self, buf):
+        # TODO clear cells packet is untested
+        self.emit('clear_cells')
+        self.world.clear_cells()
+        self.player.own_ids.clear()
+        self.player.cells_changed()
+
+    def parse_debug_line(self, buf):
+        # TODO debug line packet is untested
+        x = buf.pop_int16()
+        y = buf.pop_int16()
+        self.emit('debug_line', x=x, y=y)
+
+
+class ProtocolEncoder(object):
+    """Builds the packets sent by the client, as `bytes`."""
+
+    # format reminder
+    # b int8
+    # h int16
+    # i int32
+    # f float32
+    # d float64
+
+    def handshake(self):
+        """
+        Returns the two handshake packets that tell the server
+        which protocol to use.
+        """
+        return (struct.pack('<BI', 254, 5),
+                struct.pack('<BI', 255, handshake_version))
+
+    def token(self, token):
+        return struct.pack('<B%iB' % len(token), 80, *map(ord, token))
+
+    def facebook(self, token):
+        return struct.pack('<B%iB' % len(token), 81, *map(ord, token))
+
+    def respawn(self, nick):
+        return struct.pack('<B%iH' % len(nick), 0, *map(ord, nick))
+
+    def target(self, x, y, cid=0):
+        return struct.pack('<BiiI', 16, int(x), int(y), cid)
+
+    def spectate(self):
+        return struct.pack('<B', 1)
+
+    def spectate_toggle(self):
+        return struct.pack('<B', 18)
+
+    def split(self):
+        return struct.pack('<B', 17)
+
+    def shoot(self):
+        return struct.pack('<B', 21)
+
+    def explode(self):
+        return struct.pack('<B', 20)
@@ -0,0 +1,257 @@
+"""
+Transports move the packets between a `Client` and the server.
+
+A transport has a `connected` attribute and these methods:
+
+- `connect(url, origin=None, timeout=None)`
+- `send(packet)` sends the packet (`bytes`)
+- `recv()` returns the next received packet,
+  raises an exception if the connection got closed
+- `pending()` `True` if a packet was already received but not returned
+  by `recv()` yet, so waiting for the socket would block
+- `close()`
+- `fileno()` of the socket, to wait for it with `select` or `selectors`
+
+Optionally, to never block for the rest of a partially received packet:
+
+- `read_available()` reads once from the socket after it became readable,
+  the packets that are complete then are `pending()`
+"""
+import socket
+from collections import deque
+from urllib.parse import urlsplit
+
+from .wsframe import FrameDecoder, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG, \
+    check_handshake_response, encode_frame, handshake_request
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+
+class FrameReader(object):
+    """
+    Receiving side of the socket based transports.
+
+    Decodes the bytes read from `sock` with `agarnet.wsframe.FrameDecoder`,
+    and queues the complete messages in `messages`.
+    Subclasses provide `sock`, `close()` and `send_control()`.
+    """
+
+    def reset_reader(self, data=b''):
+        """Starts decoding a new connection, `data` was already received."""
+        self.decoder = FrameDecoder()
+        self.decoder.feed(data)
+        # received payloads, `None` or an exception once closed
+        self.messages = deque()
+
+    def send_control(self, payload, opcode):
+        """Sends a control frame, used to answer pings."""
+        raise NotImplementedError
+
+    def _decode(self):
+        """Moves all complete messages from the decoder to `messages`."""
+        decoder = self.decoder
+        while True:
+            message = decoder.next_message()
+            if message is None:
+                return
+            opcode, payload = message
+            if opcode == OPCODE_PING:
+                self.send_control(payload, OPCODE_PONG)
+            elif opcode == OPCODE_CLOSE:
+                self.messages.append(None)  # closed after the earlier ones
+                return
+            elif opcode != OPCODE_PONG:
+                self.messages.append(payload)
+
+    def read_available(self):
+        """
+        Reads once from the socket, without waiting for the rest
+        of a partially received message. Call it when `select`
+        reported the socket as readable, so it does not block.
+
+        The complete messages are then `pending()`. If the connection
+        got closed, `recv()` raises after returning the earlier messages.
+        """
+        try:
+            data = self.sock.recv(1 << 16)
+        except OSError as e:
+            self.messages.append(e)
+            return
+        if not data:
+            self.messages.append(None)
+        else:
+            self.decoder.feed(data)
+            self._decode()
+
+    def recv(self):
+        messages = self.messages
+        while not messages:
+            data = self.sock.recv(1 << 16)
+            if not data:
+                self.close()
+                raise ConnectionError('Connection closed')
+            self.decoder.feed(data)
+            self._decode()
+        payload = messages.popleft()
+        if payload is None:
+            self.close()
+            raise ConnectionError('Connection closed by server')
+        if isinstance(payload, Exception):
+            self.close()
+            raise payload
+        return payload
+
+    def pending(self):
+        if not self.messages and self.decoder.buffer:
+            self._decode()
+        return bool(self.messages)
+
+
+class WebSocketClientTransport(FrameReader):
+    """
+    Uses a `websocket.WebSocket` from the websocket-client package
+    to connect and send. Receives with `FrameReader` on its socket.
+    """
+
+    def __init__(self):
+        self.ws = websocket.WebSocket()
+        self.reset_reader()
+
+    @property
+    def connected(self):
+        return self.ws.connected
+
+    @property
+    def sock(self):
+        """The socket of the websocket, `None` if not connected."""
+        return self.ws.sock
+
+    def connect(self, url, origin=None, timeout=None):
+        self.ws.settimeout(timeout)
+        self.ws.connect(url, origin=origin)
+        self.reset_reader()  # the handshake response is read exactly
+
+    def send(self, packet):
+        self.ws.send(packet)
+
+    def send_control(self, payload, opcode):
+        self.ws.send(payload, opcode)
+
+    def close(self):
+        self.ws.close()
+
+    def fileno(self):
+        sock = self.ws.sock
+        return -1 if sock is None else sock.fileno()
+
+
+class SocketTransport(FrameReader):
+    """
+    Websocket over a plain socket, using the codec in `agarnet.wsframe`.
+
+    Reads as many bytes as available at once,
+    so several packets can be `pending()` after one `recv()`.
+    """
+
+    def __init__(self):
+        self.sock = None
+        self.reset_reader()
+        self.connected = False
+
+    def connect(self, url, origin=None, timeout=None):
+        parts = urlsplit(url)
+        address = parts.netloc
+        sock = socket.create_connection((parts.hostname, parts.port or 80),
+                                        timeout)
+        request, key = handshake_request(address, parts.path or '/',
+                                         origin)
+        try:
+            sock.sendall(request)
+            response = b''
+            while b'\r\n\r\n' not in response:
+                data = sock.recv(4096)
+                if not data:
+                    raise ConnectionError('Connection closed during handshake')
+                response += data
+            head, _, rest = response.partition(b'\r\n\r\n')
+            check_handshake_response(head + b'\r\n\r\n', key)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+        self.reset_reader(rest)
+        self.connected = True
+
+    def send(self, packet):
+        self.sock.sendall(encode_frame(packet))
+
+    def send_control(self, payload, opcode):
+        self.sock.sendall(encode_frame(payload, opcode))
+
+    def close(self):
+        if self.connected:
+            self.connected = False
+            try:
+                self.sock.sendall(encode_frame(b'', OPCODE_CLOSE))
+            except OSError:
+                pass  # already closed by the server
+            self.sock.close()
+
+    def fileno(self):
+        return -1 if self.sock is None else self.sock.fileno()
+
+
+class MemoryTransport(object):
+    """
+    In-memory pipe without any network, for tests and benchmarks.
+
+    `recv()` returns the packets passed to `feed()`, in order,
+    and closes the connection when there are none left.
+    The sent packets are collected in `sent`.
+    Has no `fileno()`, so it can not be used with `select`.
+    """
+
+    def __init__(self, packets=()):
+        self.incoming = deque(packets)
+        self.sent = []
+        self.connected = False
+        # url of the most recent `connect()`
+        self.url = None
+
+    def feed(self, *packets):
+        """Adds packets to be received."""
+        self.incoming.extend(packets)
+
+    def connect(self, url, origin=None, timeout=None):
+        self.url = url
+        self.connected = True
+
+    def send(self, packet):
+        self.sent.append(packet)
+
+    def recv(self):
+        if not self.connected:
+            raise ConnectionError('Not connected')
+        if not self.incoming:
+            self.close()
+            raise ConnectionError('No more packets')
+        return self.incoming.popleft()
+
+    def pending(self):
+        return bool(self.incoming)
+
+    def close(self):
+        self.connected = False
+
+
+def default_transport():
+    """
+    Returns a `WebSocketClientTransport` if websocket-client is installed,
+    a `SocketTransport` otherwise.
+    """
+    if websocket is not None:
+        return WebSocketClientTransport()
+    return SocketTransport()
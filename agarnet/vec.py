@@ -3,6 +3,14 @@ http://doswa.com/2009/07/13/circle-segment-intersectioncollision.html
 Slightly modified by Gjum code.gjum@gmail.com
 """
 import math
+import operator
+from array import array
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Vec(object):
@@ -213,3 +221,226 @@ class Vec(object):
 
     def __str__(self):
         return "Vec(%.3f, %.3f)" % tuple(self)
+
+
+class VecArray(object):
+    """
+    Many 2D points, stored as one array of x and one array of y coordinates.
+
+    Supports the operations of `Vec` on all points at once.
+    The other operand can be a `VecArray` of the same length,
+    or a single `Vec` or `(x, y)` pair that is applied to all points.
+    Operations that result in one number per point return an array.
+
+    Uses NumPy arrays if available, `array.array('d')` otherwise.
+    Arrays of the right type are used as they are, without copying.
+    """
+    __slots__ = ('x', 'y')
+
+    def __init__(self, x=(), y=(), use_numpy=None):
+        """
+        :param use_numpy: `True` to use NumPy arrays, `False` to use
+                          `array.array`, `None` to use NumPy if available
+        """
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        if use_numpy:
+            # no copy for float64 arrays and array('d')
+            self.x = numpy.asarray(x, dtype=numpy.float64)
+            self.y = numpy.asarray(y, dtype=numpy.float64)
+        else:
+            self.x = x if isinstance(x, array) and x.typecode == 'd' \
+                else array('d', x)
+            self.y = y if isinstance(y, array) and y.typecode == 'd' \
+                else array('d', y)
+        if len(self.x) != len(self.y):
+            raise ValueError('Different numbers of x and y coordinates: '
+                             '%i, %i' % (len(self.x), len(self.y)))
+
+    @classmethod
+    def from_vecs(cls, vecs, use_numpy=None):
+        """Copies the coordinates of the `Vec`s or `(x, y)` pairs."""
+        vecs = [tuple(v) for v in vecs]
+        return cls([v[0] for v in vecs], [v[1] for v in vecs], use_numpy)
+
+    @property
+    def use_numpy(self):
+        return not isinstance(self.x, array)
+
+    def _new(self, x, y):
+        return VecArray(x, y, self.use_numpy)
+
+    def _map(self, func, *iterables):
+        """Applies `func` to each element, for the `array` backend."""
+        return array('d', map(func, *iterables))
+
+    def _other(self, v):
+        """Returns the x and y coordinates of `v`, repeated if single."""
+        if isinstance(v, VecArray):
+            return v.x, v.y
+        x, y = v
+        if self.use_numpy:
+            return x, y  # broadcast by NumPy
+        return repeat(x), repeat(y)
+
+    def copy(self):
+        if self.use_numpy:
+            return self._new(self.x.copy(), self.y.copy())
+        return self._new(array('d', self.x), array('d', self.y))
+
+    def __add__(self, v):
+        vx, vy = self._other(v)
+        if self.use_numpy:
+            return self._new(self.x + vx, self.y + vy)
+        return self._new(self._map(operator.add, self.x, vx),
+                         self._map(operator.add, self.y, vy))
+
+    __radd__ = __add__
+
+    def __sub__(self, v):
+        vx, vy = self._other(v)
+        if self.use_numpy:
+            return self._new(self.x - vx, self.y - vy)
+        return self._new(self._map(operator.sub, self.x, vx),
+                         self._map(operator.sub, self.y, vy))
+
+    def __rsub__(self, v):
+        return self.neg() + v
+
+    def __mul__(self, s):
+        if self.use_numpy:
+            return self._new(self.x * s, self.y * s)
+        return self._new(array('d', (x * s for x in self.x)),
+                         array('d', (y * s for y in self.y)))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, s):
+        return self * (1.0 / s)
+
+    def neg(self):
+        return self * -1
+
+    __neg__ = neg
+
+    def perp(self):
+        if self.use_numpy:
+            return self._new(-self.y, self.x)
+        return self._new(array('d', (-y for y in self.y)), self.x)
+
+    def dot(self, v):
+        vx, vy = self._other(v)
+        if self.use_numpy:
+            return self.x * vx + self.y * vy
+        return self._map(lambda x, y, ox, oy: x * ox + y * oy,
+                         self.x, self.y, vx, vy)
+
+    def cross(self, v):
+        vx, vy = self._other(v)
+        if self.use_numpy:
+            return self.x * vy - vx * self.y
+        return self._map(lambda x, y, ox, oy: x * oy - ox * y,
+                         self.x, self.y, vx, vy)
+
+    def lensq(self):
+        return self.dot(self)
+
+    def len(self):
+        if self.use_numpy:
+            return numpy.hypot(self.x, self.y)
+        return self._map(math.hypot, self.x, self.y)
+
+    def unit(self):
+        """Points of length 0 stay at `(0, 0)`."""
+        lengths = self.len()
+        if self.use_numpy:
+            lengths[lengths == 0] = 1
+            return self._new(self.x / lengths, self.y / lengths)
+        lengths = [length or 1 for length in lengths]
+        return self._new(self._map(operator.truediv, self.x, lengths),
+                         self._map(operator.truediv, self.y, lengths))
+
+    def rot(self, angle):
+        c = math.cos(angle)
+        s = math.sin(angle)
+        if self.use_numpy:
+            return self._new(self.x * c - self.y * s, self.x * s + self.y * c)
+        return self._new(
+            self._map(lambda x, y: x * c - y * s, self.x, self.y),
+            self._map(lambda x, y: x * s + y * c, self.x, self.y))
+
+    def proj(self, v):
+        if isinstance(v, VecArray):
+            return self.dot(v.unit())
+        return self.dot(Vec(v).unit())
+
+    def angle(self):
+        if self.use_numpy:
+            return numpy.arctan2(self.y, self.x)
+        return self._map(math.atan2, self.y, self.x)
+
+    def angle_to(self, other):
+        cross = self.cross(other)
+        dot = self.dot(other)
+        if self.use_numpy:
+            return numpy.arctan2(cross, dot)
+        return self._map(math.atan2, cross, dot)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, i):
+        return Vec(float(self.x[i]), float(self.y[i]))
+
+    def __iter__(self):
+        for x, y in zip(self.x, self.y):
+            yield Vec(float(x), float(y))
+
+    def __str__(self):
+        return "VecArray(%i points)" % len(self)
+
+
+def segment_circle_hits(start, end, centers, radii):
+    """
+    Tests the segment from `start` to `end` against many circles.
+
+    Returns an array with the distance from `start` along the segment
+    to where it enters each circle, `0` if `start` is inside the circle,
+    and `inf` if the segment misses it.
+
+    :param start: `Vec` or `(x, y)` pair
+    :param end: `Vec` or `(x, y)` pair
+    :param centers: `VecArray` of the circle centers
+    :param radii: sequence of the circle radii, same length as `centers`
+    """
+    start = Vec(start)
+    direction = Vec(end) - start
+    length = direction.len()
+    rel = centers - start
+    if length == 0:  # only test if the start is inside
+        proj = rel.dot((0, 0))
+    else:
+        proj = rel.dot(direction.idiv(length))
+    lensq = rel.lensq()
+    if centers.use_numpy:
+        radii = numpy.asarray(radii, dtype=numpy.float64)
+        # squared half chord length, negative if the line misses
+        half_sq = radii * radii - lensq + proj * proj
+        half = numpy.sqrt(numpy.maximum(half_sq, 0))
+        entry = proj - half
+        hit = (half_sq >= 0) & (proj + half >= 0) & (entry <= length)
+        return numpy.where(hit, numpy.maximum(entry, 0), numpy.inf)
+    inf = float('inf')
+    hits = array('d')
+    for p, lsq, r in zip(proj, lensq, radii):
+        half_sq = r * r - lsq + p * p
+        if half_sq < 0:
+            hits.append(inf)
+            continue
+        half = math.sqrt(half_sq)
+        entry = p - half
+        if p + half < 0 or entry > length:
+            hits.append(inf)
+        else:
+            hits.append(max(entry, 0))
+    return hits
@@ -1,22 +1,72 @@
-from .vec import Vec
+import math
+from array import array
+
+from .index import CategoryIndex, CellGroup, MassOrder, PlayerIndex, \
+    SpatialGrid, UpdateTicks
+from .vec import Vec, VecArray, segment_circle_hits
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Flags returned by `Player.classify_cells()`.
+THREAT = 1  # can eat one of the own cells
+PREY = 2  # can be eaten by one of the own cells
+SPLIT_THREAT = 4  # can split and eat one of the own cells
+SPLIT_PREY = 8  # can be eaten by one of the own cells by splitting
+
+
+# raw `(r, g, b)` -> normalized color, shared by all cells of that color
+_colors = {}
+
+
+def normalize_color(color):
+    """
+    Returns the color with each channel divided by 255.
+    The same tuple is returned for repeated colors.
+    """
+    try:
+        return _colors[color]
+    except KeyError:
+        if len(_colors) >= 4096:
+            _colors.clear()
+        normalized = _colors[color] = tuple(c / 255.0 for c in color)
+        return normalized
 
 
 class Cell(object):
+    __slots__ = ('cid', 'pos', 'size', 'name', 'color',
+                 'is_virus', 'is_agitated')
+
     def __init__(self, *args, **kwargs):
         self.pos = Vec()
+        self.name = ''
         self.update(*args, **kwargs)
 
+    def reset(self):
+        """
+        Resets all attributes to their defaults, keeping the `pos` instance.
+        Used when reusing the cell for another ID.
+        """
+        self.name = ''
+        self.update()
+
     def update(self, cid=-1, x=0, y=0, size=0, name='',
                color=(1, 0, 1), is_virus=False, is_agitated=False):
         self.cid = cid
         self.pos.set(x, y)
         self.size = size
-        self.mass = size ** 2 / 100.0
-        self.name = getattr(self, 'name', name) or name
-        self.color = tuple(map(lambda rgb: rgb / 255.0, color))
+        if not self.name:
+            self.name = name
+        self.color = normalize_color(tuple(color))
         self.is_virus = is_virus
         self.is_agitated = is_agitated
 
+    @property
+    def mass(self):
+        return self.size ** 2 / 100.0
+
     @property
     def is_food(self):
         return self.size < 20 and not self.name
@@ -39,11 +89,57 @@ class Cell(object):
         return self.cid < other.cid
 
 
+class EvictionPolicy(object):
+    """
+    When to remove cells from the world that the server did not update
+    recently. Each limit can be `None` to disable it.
+    """
+
+    def __init__(self, max_age=None, max_distance=None, max_cells=None):
+        # Remove cells that were not updated for more than this many ticks.
+        self.max_age = max_age
+
+        # Remove cells further away than this from the player's center,
+        # unless they were updated in the current tick.
+        self.max_distance = max_distance
+
+        # Remove the least recently updated cells
+        # while there are more cells than this.
+        self.max_cells = max_cells
+
+
 class World(object):
     cell_class = Cell
 
+    # Width and height of the spatial index buckets.
+    grid_size = 500
+
+    # Maximum number of removed cells kept for reuse, `0` to disable.
+    pool_size = 0
+
     def __init__(self):
         self.cells = {}
+        # Removed cells that get reused by `create_cell()`.
+        self.pool = []
+        # Numbers of cells instantiated and reused by `create_cell()`.
+        self.cells_created = 0
+        self.cells_reused = 0
+        # `SpatialGrid` of the cell positions, built on first use,
+        # see `grid`.
+        self._grid = None
+        # The tick in which each cell was last updated,
+        # only tracked while `eviction` is set.
+        self.update_ticks = UpdateTicks()
+        # The IDs of all food, virus, ejected mass, and player cells.
+        self.categories = CategoryIndex()
+        # `PlayerIndex`, built on first use, see `players`.
+        self._players = None
+        # Get updated in `update_cell()` and `remove_cell()`.
+        self.indexes = [self.categories]
+        # `MassOrder` index, see `sort_by_mass`.
+        self.mass_order = None
+        # `EvictionPolicy`, see `eviction`.
+        self._eviction = None
         self.leaderboard_names = []
         self.leaderboard_groups = []
         self.top_left = Vec(0, 0)
@@ -54,7 +150,7 @@ class World(object):
         """
         Clears the `cells` and leaderboards, and sets all corners to `0,0`.
         """
-        self.cells.clear()
+        self.clear_cells()
         self.leaderboard_names.clear()
         self.leaderboard_groups.clear()
         self.top_left.set(0, 0)
@@ -64,8 +160,328 @@ class World(object):
         """
         Creates a new cell in the world.
         Override to use a custom cell class.
+
+        Reuses a removed cell from the `pool` if possible.
+        """
+        pool = self.pool
+        if pool and type(pool[-1]) is self.cell_class:
+            cell = pool.pop()
+            cell.reset()
+            self.cells_reused += 1
+        else:
+            if pool:  # cell_class changed
+                pool.clear()
+            cell = self.cell_class()
+            self.cells_created += 1
+        cell.cid = cid  # indexes built before its first update need it
+        self.cells[cid] = cell
+
+    def update_cell(self, cid, x, y, size, name, color, is_virus, is_agitated):
         """
-        self.cells[cid] = self.cell_class()
+        Updates the cell with the data received from the server,
+        creating it first if it is not in the world yet.
+        """
+        cells = self.cells
+        if cid not in cells:
+            self.create_cell(cid)
+        cell = cells[cid]
+        cell.update(
+            cid=cid, x=x, y=y, size=size, name=name, color=color,
+            is_virus=is_virus, is_agitated=is_agitated)
+        self.cell_updated(cell)
+
+    def cell_updated(self, cell):
+        """
+        Updates the indexes with the cell's current data.
+        Call this after changing a cell outside of `update_cell()`.
+        """
+        for index in self.indexes:
+            index.update(cell)
+
+    def remove_cell(self, cid):
+        """
+        Removes the cell from the world.
+
+        If the `pool` is not full, keeps the cell for reuse.
+        """
+        if len(self.pool) < self.pool_size:
+            self.pool.append(self.cells.pop(cid))
+        else:
+            del self.cells[cid]
+        for index in self.indexes:
+            index.remove(cid)
+
+    def clear_cells(self):
+        """
+        Removes all cells from the world.
+        """
+        self.cells.clear()
+        for index in self.indexes:
+            index.clear()
+
+    @property
+    def food(self):
+        """Set of the IDs of all food cells. Do not modify it."""
+        return self.categories.food
+
+    @property
+    def viruses(self):
+        """Set of the IDs of all viruses. Do not modify it."""
+        return self.categories.viruses
+
+    @property
+    def ejected(self):
+        """Set of the IDs of all ejected mass cells. Do not modify it."""
+        return self.categories.ejected
+
+    @property
+    def player_cells(self):
+        """
+        Set of the IDs of all cells that are not food, viruses,
+        or ejected mass. Do not modify it.
+        """
+        return self.categories.player_cells
+
+    @property
+    def players(self):
+        """
+        `PlayerIndex` of the player cells, grouped by their owner.
+
+        Built on first access and updated from then on,
+        so worlds that never group cells by player do not maintain it.
+        """
+        if self._players is None:
+            self._players = self._add_index(PlayerIndex())
+        return self._players
+
+    def cells_of_player(self, cell):
+        """
+        Returns a list of all cells of the player that owns `cell`,
+        the same cells for which `cell.same_player()` is `True`.
+        Empty for food, viruses and ejected mass.
+        """
+        group = self.players.group_of(cell.cid)
+        if group is None:
+            return []
+        cells = self.cells
+        return [cells[cid] for cid in group.members]
+
+    def positions(self, use_numpy=None):
+        """
+        Returns `(cids, positions)`, the IDs of all cells
+        and a `VecArray` of their positions in the same order.
+
+        Copies all positions into new arrays on each call,
+        only `ColumnarWorld.positions()` avoids the copy.
+
+        :param use_numpy: passed to `VecArray`
+        """
+        cells = list(self.cells.values())
+        return [c.cid for c in cells], VecArray(
+            [c.pos.x for c in cells], [c.pos.y for c in cells], use_numpy)
+
+    def _add_index(self, index):
+        """
+        Indexes all current cells in `index`, and adds it to `indexes`
+        so it gets updated from now on. Returns the index.
+        """
+        for cell in self.cells.values():
+            index.update(cell)
+        self.indexes.append(index)
+        return index
+
+    @property
+    def grid(self):
+        """
+        `SpatialGrid` of the cell positions, for `cells_in_rect()` etc.
+
+        Built on first access and updated from then on,
+        so worlds that are never queried by area do not maintain it.
+        """
+        if self._grid is None:
+            self._grid = self._add_index(SpatialGrid(self.grid_size))
+        return self._grid
+
+    @property
+    def sort_by_mass(self):
+        """
+        Set to `True` to keep the cell IDs sorted by mass in `mass_order`.
+        """
+        return self.mass_order is not None
+
+    @sort_by_mass.setter
+    def sort_by_mass(self, enable):
+        if enable and self.mass_order is None:
+            self.mass_order = self._add_index(MassOrder())
+        elif not enable and self.mass_order is not None:
+            self.indexes.remove(self.mass_order)
+            self.mass_order = None
+
+    @property
+    def eviction(self):
+        """
+        `EvictionPolicy` for removing stale cells, `None` to keep them.
+
+        The cells' update ticks are only tracked while it is set.
+        When setting it, the current cells count as updated in this tick.
+        """
+        return self._eviction
+
+    @eviction.setter
+    def eviction(self, policy):
+        tracking = self._eviction is not None
+        if policy is not None and not tracking:
+            self._add_index(self.update_ticks)
+        elif policy is None and tracking:
+            self.indexes.remove(self.update_ticks)
+            self.update_ticks.clear()
+        self._eviction = policy
+
+    @property
+    def tick(self):
+        """Number of world updates, used to track when cells were updated."""
+        return self.update_ticks.tick
+
+    def next_tick(self):
+        """
+        Starts the next tick. Called before applying each world update.
+        """
+        self.update_ticks.tick += 1
+
+    def stale_cell_ids(self, center, keep=()):
+        """
+        Returns a set of the IDs of all cells that
+        should be removed according to the `eviction` policy.
+
+        :param center: position to measure `EvictionPolicy.max_distance` from
+        :param keep: IDs of cells that must not be removed
+        """
+        policy = self.eviction
+        stale = set()
+        if policy is None:
+            return stale
+        tick = self.tick
+        ticks = self.update_ticks
+
+        if policy.max_age is not None:
+            min_tick = tick - policy.max_age
+            for cid, cell_tick in ticks.oldest():
+                if cell_tick >= min_tick:
+                    break
+                stale.add(cid)
+
+        if policy.max_distance is not None:
+            x, y = center
+            cell_ticks = ticks.ticks
+            stale.update(cid for cid in self.grid.ids_outside(
+                x, y, policy.max_distance) if cell_ticks[cid] < tick)
+
+        stale.difference_update(keep)
+
+        if policy.max_cells is not None:
+            excess = len(self.cells) - len(stale) - policy.max_cells
+            for cid, cell_tick in ticks.oldest():
+                if excess <= 0:
+                    break
+                if cid not in stale and cid not in keep:
+                    stale.add(cid)
+                    excess -= 1
+
+        return stale
+
+    def cells_in_rect(self, top_left, bottom_right):
+        """
+        Returns a list of all cells whose center is inside the rectangle.
+        Can be used with `Player.visible_area`.
+        """
+        cells = self.cells
+        left, top = top_left
+        right, bottom = bottom_right
+        return [cells[cid] for cid
+                in self.grid.ids_in_rect(left, top, right, bottom)]
+
+    def cells_within(self, pos, radius):
+        """
+        Returns a list of all cells whose center is within `radius` of `pos`.
+        """
+        cells = self.cells
+        x, y = pos
+        return [cells[cid] for cid in self.grid.ids_within(x, y, radius)]
+
+    def nearest(self, pos, k=1, predicate=None):
+        """
+        Returns a list of the `k` cells closest to `pos`, closest first.
+
+        If given, only cells for which `predicate(cell)` is `True` count.
+        """
+        cells = self.cells
+        x, y = pos
+        accept = None if predicate is None \
+            else lambda cid: predicate(cells[cid])
+        return [cells[cid] for cid in self.grid.nearest_ids(x, y, k, accept)]
+
+    def segment_hit(self, start, end, radius=0, predicate=None,
+                    max_size=None):
+        """
+        Returns `(cell, distance)` for the first cell that the segment
+        from `start` to `end` hits, `None` if it hits no cell.
+
+        See `segment_hits()` for the parameters.
+        """
+        return self.segment_hits([(start, end)], radius, predicate,
+                                 max_size)[0]
+
+    def segment_hits(self, segments, radius=0, predicate=None,
+                     max_size=None):
+        """
+        Finds the first cell that each segment hits.
+
+        Returns a list with one `(cell, distance)` pair per segment,
+        or `None` if that segment hits no cell.
+        `distance` is measured from the segment's start, and is `0`
+        if the start is inside the cell.
+
+        :param segments: list of `(start, end)` pairs of positions
+        :param radius: added to the cell sizes, for example the size
+                       of a cell that moves along the segments
+        :param predicate: only cells for which `predicate(cell)` is `True`
+                          are tested
+        :param max_size: the largest cell size, so only cells near the
+                         segments have to be tested. Taken from
+                         `mass_order` if enabled, otherwise all cells
+                         are tested.
+        """
+        if max_size is None and self.mass_order:
+            max_size = math.sqrt(self.cells[self.mass_order.largest()[0]]
+                                 .mass * 100)
+        if max_size is None:
+            cells = list(self.cells.values())
+        else:
+            xs = [p[0] for segment in segments for p in segment]
+            ys = [p[1] for segment in segments for p in segment]
+            margin = max_size + radius
+            cells = [self.cells[cid] for cid in self.grid.ids_in_rect(
+                min(xs) - margin, min(ys) - margin,
+                max(xs) + margin, max(ys) + margin)]
+        if predicate is not None:
+            cells = [c for c in cells if predicate(c)]
+        if not cells:
+            return [None] * len(segments)
+
+        centers = VecArray.from_vecs(c.pos for c in cells)
+        radii = [c.size + radius for c in cells]
+        results = []
+        for start, end in segments:
+            hits = segment_circle_hits(start, end, centers, radii)
+            if centers.use_numpy:
+                i = int(hits.argmin())
+            else:
+                i = min(range(len(hits)), key=hits.__getitem__)
+            if hits[i] == float('inf'):
+                results.append(None)
+            else:
+                results.append((cells[i], float(hits[i])))
+        return results
 
     @property
     def center(self):
@@ -90,14 +506,46 @@ class World(object):
         return True
 
 
+class OwnCellsIndex(object):
+    """
+    Keeps `Player.own_stats` up to date while the world's cells change.
+    """
+
+    def __init__(self, player):
+        self.player = player
+
+    def update(self, cell):
+        player = self.player
+        if cell.cid in player.own_ids:
+            x, y = cell.pos
+            player.own_stats.set(cell.cid, x, y, cell.size, cell.mass)
+
+    def remove(self, cid):
+        self.player.own_stats.discard(cid)
+
+    def clear(self):
+        self.player.own_stats.clear()
+
+
 class Player(object):
-    def __init__(self):
-        # The world that the player's cells are in.
-        self.world = World()
+    # A cell can eat another cell that has at most `1 / eat_ratio` its mass.
+    eat_ratio = 1.25
 
+    # How far a cell can reach by splitting, measured from its edge.
+    split_distance = 700
+
+    def __init__(self):
         # All controlled cell IDs.
         self.own_ids = set()
 
+        # Aggregates of the controlled cells, see `cells_changed()`.
+        self.own_stats = CellGroup()
+        self._own_index = OwnCellsIndex(self)
+
+        # The world that the player's cells are in.
+        self._world = None
+        self.world = World()
+
         # The center of all controlled cells.
         self.center = self.world.center
 
@@ -122,23 +570,49 @@ class Player(object):
         self.center = self.world.center
         self.cells_changed()
 
+    @property
+    def world(self):
+        return self._world
+
+    @world.setter
+    def world(self, world):
+        if self._world is not None:
+            self._world.indexes.remove(self._own_index)
+        self._world = world
+        world.indexes.append(self._own_index)
+        self.own_stats.clear()  # gets filled again in cells_changed()
+
     def cells_changed(self):
         """
         Calculates `total_size`, `total_mass`, `scale`, and `center`.
 
         Has to be called when the controlled cells (`own_ids`) change.
+
+        Updates of the controlled cells in the world are tracked by
+        `own_stats` as they happen, so this only has to add and remove
+        the cells whose IDs were added to or removed from `own_ids`.
         """
-        self.total_size = sum(cell.size for cell in self.own_cells)
-        self.total_mass = sum(cell.mass for cell in self.own_cells)
+        stats = self.own_stats
+        members = stats.members
+        own_ids = self.own_ids
+        if len(members) != len(own_ids) or members.keys() != own_ids:
+            for cid in members.keys() - own_ids:
+                stats.discard(cid)
+            cells = self.world.cells
+            for cid in own_ids - members.keys():
+                cell = cells.get(cid)
+                if cell is not None:
+                    x, y = cell.pos
+                    stats.set(cid, x, y, cell.size, cell.mass)
+
+        self.total_size = stats.total_size
+        self.total_mass = stats.total_mass
         self.scale = pow(min(1.0, 64.0 / self.total_size), 0.4) \
             if self.total_size > 0 else 1.0
 
-        if self.own_ids:
-            left = min(cell.pos.x for cell in self.own_cells)
-            right = max(cell.pos.x for cell in self.own_cells)
-            top = min(cell.pos.y for cell in self.own_cells)
-            bottom = max(cell.pos.y for cell in self.own_cells)
-            self.center = Vec(left + right, top + bottom) / 2
+        center = stats.center
+        if center is not None:
+            self.center.set(*center)
 
         # else: keep old center
 
@@ -147,6 +621,66 @@ class Player(object):
         cells = self.world.cells
         return (cells[cid] for cid in self.own_ids)
 
+    def classify_cells(self, cids=None, eat_ratio=None, split_distance=None,
+                       use_numpy=None):
+        """
+        Compares the cells to all own cells at once.
+
+        Returns `(cids, flags, distances)`, where `flags` has one bitmask
+        of `THREAT`, `PREY`, `SPLIT_THREAT` and `SPLIT_PREY` per cell,
+        and `distances` the distance from each cell's center
+        to the closest own cell's center.
+
+        When splitting, each half has half the mass, and reaches cells
+        whose center is at most `split_distance` from the splitting
+        cell's edge.
+
+        :param cids: IDs of the cells to classify, defaults to all
+                     `world.player_cells` that are not own cells
+        :param eat_ratio: defaults to `Player.eat_ratio`
+        :param split_distance: defaults to `Player.split_distance`
+        :param use_numpy: `True` to return NumPy arrays, `False` to
+                          return `array.array`, `None` to use NumPy
+                          if available
+        """
+        if eat_ratio is None:
+            eat_ratio = self.eat_ratio
+        if split_distance is None:
+            split_distance = self.split_distance
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        world = self.world
+        if cids is None:
+            cids = list(world.player_cells - self.own_ids)
+        cells = [world.cells[cid] for cid in cids]
+        own = list(self.own_cells)
+        if use_numpy:
+            return (cids,) + _classify_numpy(own, cells, eat_ratio,
+                                             split_distance)
+
+        flags = array('B', bytes(len(cells)))
+        distances = array('d', [float('inf')]) * len(cells)
+        for i, cell in enumerate(cells):
+            x, y = cell.pos
+            size, mass = cell.size, cell.mass
+            flag = 0
+            for o in own:
+                dist = math.hypot(x - o.pos.x, y - o.pos.y)
+                if dist < distances[i]:
+                    distances[i] = dist
+                if mass >= eat_ratio * o.mass:
+                    flag |= THREAT
+                    if mass / 2 >= eat_ratio * o.mass \
+                            and dist - size <= split_distance:
+                        flag |= SPLIT_THREAT
+                if o.mass >= eat_ratio * mass:
+                    flag |= PREY
+                    if o.mass / 2 >= eat_ratio * mass \
+                            and dist - o.size <= split_distance:
+                        flag |= SPLIT_PREY
+            flags[i] = flag
+        return cids, flags, distances
+
     @property
     def is_alive(self):
         return bool(self.own_ids)
@@ -166,3 +700,38 @@ class Player(object):
         top_left = self.world.center - half_viewport
         bottom_right = self.world.center + half_viewport
         return top_left, bottom_right
+
+    @property
+    def visible_cells(self):
+        """
+        All cells in `visible_area`, found using the world's spatial index.
+        """
+        return self.world.cells_in_rect(*self.visible_area)
+
+
+def _classify_numpy(own, cells, eat_ratio, split_distance):
+    """Vectorized `Player.classify_cells()`, returns `(flags, distances)`."""
+    def columns(group):
+        return (numpy.array([[c.pos.x for c in group]]).T,
+                numpy.array([[c.pos.y for c in group]]).T,
+                numpy.array([[c.size for c in group]]).T,
+                numpy.array([[c.mass for c in group]]).T)
+
+    if not own or not cells:
+        return (numpy.zeros(len(cells), numpy.uint8),
+                numpy.full(len(cells), numpy.inf))
+    # own cells are rows, other cells are columns
+    ox, oy, osize, omass = columns(own)
+    x, y, size, mass = (c.T for c in columns(cells))
+    dist = numpy.hypot(x - ox, y - oy)
+    threat = mass >= eat_ratio * omass
+    prey = omass >= eat_ratio * mass
+    split_threat = (mass / 2 >= eat_ratio * omass) \
+        & (dist - size <= split_distance)
+    split_prey = (omass / 2 >= eat_ratio * mass) \
+        & (dist - osize <= split_distance)
+    flags = threat.any(axis=0) * numpy.uint8(THREAT) \
+        | prey.any(axis=0) * numpy.uint8(PREY) \
+        | split_threat.any(axis=0) * numpy.uint8(SPLIT_THREAT) \
+        | split_prey.any(axis=0) * numpy.uint8(SPLIT_PREY)
+    return flags.astype(numpy.uint8), dist.min(axis=0)
@@ -0,0 +1,173 @@
+"""
+Sans-IO websocket (RFC 6455) handshake and frame codec, client side.
+
+Only builds and parses bytes, so it can be used with blocking sockets,
+asyncio streams, or anything else that moves bytes.
+"""
+import base64
+import hashlib
+import os
+import struct
+
+OPCODE_CONTINUATION = 0
+OPCODE_TEXT = 1
+OPCODE_BINARY = 2
+OPCODE_CLOSE = 8
+OPCODE_PING = 9
+OPCODE_PONG = 10
+
+ws_guid = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class HandshakeError(Exception):
+    """The server did not accept the websocket handshake."""
+
+
+def accept_key(key):
+    """Returns the `Sec-WebSocket-Accept` value expected for `key`."""
+    return base64.b64encode(hashlib.sha1(key + ws_guid).digest())
+
+
+def handshake_request(address, path='/', origin=None, key=None):
+    """
+    Returns `(request, key)`, the HTTP upgrade request (`bytes`)
+    and the random key the response has to be checked against.
+
+    :param address: string, `IP:PORT` or `host:port`
+    """
+    if key is None:
+        key = base64.b64encode(os.urandom(16))
+    lines = ['GET %s HTTP/1.1' % path,
+             'Host: %s' % address,
+             'Upgrade: websocket',
+             'Connection: Upgrade',
+             'Sec-WebSocket-Key: %s' % key.decode(),
+             'Sec-WebSocket-Version: 13']
+    if origin:
+        lines.append('Origin: %s' % origin)
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode(), key
+
+
+def check_handshake_response(response, key):
+    """
+    Raises `HandshakeError` if the response (`bytes`, up to and including
+    the empty line) does not accept the handshake made with `key`.
+    """
+    lines = response.split(b'\r\n')
+    status = lines[0].split(b' ', 2)
+    if len(status) < 2 or status[1] != b'101':
+        raise HandshakeError('Unexpected response: %r' % lines[0])
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(b':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    if headers.get(b'sec-websocket-accept') != accept_key(key):
+        raise HandshakeError('Invalid Sec-WebSocket-Accept header')
+
+
+def mask(payload, mask_key):
+    """XORs the payload with the 4 byte `mask_key`."""
+    length = len(payload)
+    if not length:
+        return b''
+    key = (mask_key * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'little')
+            ^ int.from_bytes(key, 'little')).to_bytes(length, 'little')
+
+
+def encode_frame(payload, opcode=OPCODE_BINARY, mask_key=None):
+    """
+    Builds a single final frame. Client frames have to be masked,
+    so a random `mask_key` is used if none is given,
+    pass `b''` to send the payload unmasked.
+    """
+    if mask_key is None:
+        mask_key = os.urandom(4)
+    masked = 0x80 if mask_key else 0
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, masked | length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, masked | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, masked | 127, length)
+    if mask_key:
+        return header + mask_key + mask(payload, mask_key)
+    return header + payload
+
+
+class FrameDecoder(object):
+    """
+    Collects received bytes and splits them into messages.
+
+    Fragmented messages are joined, control frames
+    (close, ping, pong) are returned as they arrive.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # start of the unparsed bytes in `buffer`
+        self.offset = 0
+        # opcode and parts of the fragmented message being received
+        self._opcode = None
+        self._parts = []
+
+    def feed(self, data):
+        """Adds received bytes."""
+        if self.offset:  # drop the parsed bytes before growing the buffer
+            del self.buffer[:self.offset]
+            self.offset = 0
+        self.buffer += data
+
+    def next_message(self):
+        """
+        Returns `(opcode, payload)` of the next complete message,
+        or `None` if more bytes have to be fed first.
+        """
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return None
+            final, opcode, payload = frame
+            if opcode >= OPCODE_CLOSE:  # control frames are never fragmented
+                return opcode, payload
+            if opcode != OPCODE_CONTINUATION:
+                self._opcode = opcode
+            self._parts.append(payload)
+            if final:
+                parts, self._parts = self._parts, []
+                if len(parts) == 1:
+                    return self._opcode, parts[0]
+                return self._opcode, b''.join(parts)
+
+    def _next_frame(self):
+        buf = self.buffer
+        start = self.offset
+        if len(buf) < start + 2:
+            return None
+        first, second = buf[start], buf[start + 1]
+        length = second & 0x7f
+        pos = start + 2
+        if length == 126:
+            if len(buf) < pos + 2:
+                return None
+            length, = struct.unpack_from('!H', buf, pos)
+            pos += 2
+        elif length == 127:
+            if len(buf) < pos + 8:
+                return None
+            length, = struct.unpack_from('!Q', buf, pos)
+            pos += 8
+        mask_key = None
+        if second & 0x80:
+            mask_key = bytes(buf[pos:pos + 4])
+            pos += 4
+        end = pos + length
+        if len(buf) < end:
+            return None
+        payload = bytes(buf[pos:end])
+        self.offset = end
+        if mask_key:
+            payload = mask(payload, mask_key)
+        return bool(first & 0x80), first & 0x0f, payload
@@ -0,0 +1,72 @@
+"""
+Measures the memory used per cell by the different cell storages.
+
+Usage: PYTHONPATH=. python3 benchmarks/cell_memory.py [number of cells]
+"""
+import sys
+import tracemalloc
+
+from agarnet.columnar import ColumnarWorld
+from agarnet.vec import Vec
+from agarnet.world import World
+
+
+class BaselineCell(object):
+    """
+    The cell as it was before `Cell` got `__slots__`: with a `__dict__`,
+    and its own `mass` float and normalized color tuple.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.pos = Vec()
+        self.update(*args, **kwargs)
+
+    def update(self, cid=-1, x=0, y=0, size=0, name='',
+               color=(1, 0, 1), is_virus=False, is_agitated=False):
+        self.cid = cid
+        self.pos.set(x, y)
+        self.size = size
+        self.mass = size ** 2 / 100.0
+        self.name = getattr(self, 'name', name) or name
+        self.color = tuple(map(lambda rgb: rgb / 255.0, color))
+        self.is_virus = is_virus
+        self.is_agitated = is_agitated
+
+
+def fill(world, n):
+    for cid in range(1, n + 1):
+        world.update_cell(cid, cid % 7000, cid % 5000, 10 + cid % 300,
+                          'name %i' % (cid % 100) if cid % 10 == 0 else '',
+                          (cid % 256, 0, 255), False, False)
+
+
+def measure(make_world, n):
+    tracemalloc.start()
+    world = make_world()
+    # measure the cells only, not the indexes
+    world.indexes.clear()
+    before = tracemalloc.get_traced_memory()[0]
+    fill(world, n)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n
+
+
+def baseline_cell_world():
+    world = World()
+    world.cell_class = BaselineCell
+    return world
+
+
+def main(n=100000):
+    for name, make_world in (
+            ('Cell before __slots__', baseline_cell_world),
+            ('Cell', World),
+            ('ColumnarWorld', ColumnarWorld),
+            ('ColumnarWorld, no NumPy', lambda: ColumnarWorld(False)),
+    ):
+        print('%-24s %6.1f bytes per cell' % (name, measure(make_world, n)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,48 @@
+"""
+Measures how long a client takes to parse `world_update` packets,
+fed through a `MemoryTransport` without any network.
+
+Usage: PYTHONPATH=. python3 benchmarks/parse_packets.py [cells] [packets]
+"""
+import random
+import struct
+import sys
+import time
+
+from agarnet.client import Client
+from agarnet.transport import MemoryTransport
+
+
+class NullSubscriber(object):
+    def __getattr__(self, item):
+        return lambda *args, **kwargs: None
+
+
+def world_update_packet(cells, rnd):
+    parts = [struct.pack('<BH', 16, 0)]
+    for cid in range(1, cells + 1):
+        parts.append(struct.pack('<IiihBBBB', cid, rnd.randint(-7000, 7000),
+                                 rnd.randint(-7000, 7000),
+                                 rnd.randint(10, 300), 1, 2, 3, 0))
+        name = 'name %i' % (cid % 50) if cid % 5 == 0 else ''
+        parts.append(name.encode('utf-16-le') + b'\0\0')
+    parts.append(struct.pack('<II', 0, 0))
+    return b''.join(parts)
+
+
+def main(cells=3000, packets=50):
+    rnd = random.Random(1)
+    transport = MemoryTransport(
+        world_update_packet(cells, rnd) for _ in range(packets))
+    client = Client(NullSubscriber(), transport)
+    client.connect('127.0.0.1:443')
+    start = time.perf_counter()
+    while transport.pending():
+        client.on_message()
+    elapsed = time.perf_counter() - start
+    print('%i cells: %.2f ms per packet'
+          % (cells, elapsed / packets * 1000))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
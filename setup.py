@@ -9,6 +9,7 @@ setup(name='agarnet',
       version='0.2.4',
       description='agar.io client and connection toolkit',
       install_requires=['websocket-client>=0.32.0'],
+      extras_require={'numpy': ['numpy']},
       author='Gjum',
       author_email='code.gjum@gmail.com',
       url='https://github.com/Gjum/agarnet',
@@ -0,0 +1,4 @@
+import sys
+
+# agarnet.aio uses async/await syntax and StreamReader.readuntil()
+collect_ignore = [] if sys.version_info >= (3, 5, 2) else ['test_aio.py']
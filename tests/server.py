@@ -0,0 +1,118 @@
+"""
+Minimal local websocket server that stands in for a game server in tests.
+"""
+import base64
+import hashlib
+import socket
+import struct
+import threading
+
+ws_guid = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+def encode_frame(payload, opcode=2):
+    """Builds an unmasked server frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def recv_exactly(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+def recv_frame(sock):
+    """Returns `(opcode, payload)` of the next client frame."""
+    first, second = recv_exactly(sock, 2)
+    length = second & 0x7f
+    if length == 126:
+        length, = struct.unpack('!H', recv_exactly(sock, 2))
+    elif length == 127:
+        length, = struct.unpack('!Q', recv_exactly(sock, 8))
+    mask = recv_exactly(sock, 4) if second & 0x80 else b'\0\0\0\0'
+    payload = recv_exactly(sock, length)
+    return first & 0x0f, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+class StandInServer(object):
+    """
+    Accepts websocket connections on a free local port.
+
+    Each connection first receives `expect` frames from the client,
+    then gets sent all `packets`, and is closed after that.
+    The frames received from each client are collected in `received`.
+    """
+
+    def __init__(self, packets=(), expect=2):
+        self.packets = list(packets)
+        self.expect = expect
+        self.received = []  # list of frame payloads per connection
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(64)
+        self.address = '%s:%i' % self.sock.getsockname()
+        self.threads = []
+        thread = threading.Thread(target=self.serve, daemon=True)
+        thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # closed
+            received = []
+            self.received.append(received)
+            thread = threading.Thread(target=self.handle,
+                                      args=(conn, received), daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def handle(self, conn, received):
+        with conn:
+            request = b''
+            while b'\r\n\r\n' not in request:
+                request += conn.recv(4096)
+            key = [line.split(b':', 1)[1].strip()
+                   for line in request.split(b'\r\n')
+                   if line.lower().startswith(b'sec-websocket-key:')][0]
+            accept = base64.b64encode(hashlib.sha1(key + ws_guid).digest())
+            conn.sendall(b'HTTP/1.1 101 Switching Protocols\r\n'
+                         b'Upgrade: websocket\r\nConnection: Upgrade\r\n'
+                         b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+            try:
+                for _ in range(self.expect):
+                    received.append(recv_frame(conn)[1])
+                self.send_packets(conn)
+                conn.shutdown(socket.SHUT_WR)
+                while True:  # until the client closes the connection
+                    opcode, payload = recv_frame(conn)
+                    if opcode == 8:
+                        break
+                    received.append(payload)
+            except (EOFError, OSError):
+                pass
+
+    def send_packets(self, conn):
+        """Sends all `packets`, override to send them differently."""
+        conn.sendall(b''.join(map(encode_frame, self.packets)))
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)  # wakes up accept()
+        except OSError:
+            pass
+        self.sock.close()
+        for thread in self.threads:
+            thread.join(5)
@@ -0,0 +1,108 @@
+import asyncio
+import unittest
+
+from agarnet.aio import AsyncClient, UnconnectedTransport
+
+from .server import StandInServer
+from .test_pool import CountingSubscriber, packets
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class QueueTransport(object):
+    """Receives the packets put into its queue, `None` closes it."""
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.sent = []
+        self.connected = True
+
+    def send(self, packet):
+        self.sent.append(packet)
+
+    async def recv(self):
+        packet = await self.queue.get()
+        if packet is None:
+            self.close()
+            raise ConnectionError('Connection closed')
+        return packet
+
+    def close(self):
+        self.connected = False
+
+
+class AsyncClientTest(unittest.TestCase):
+    def test_stand_in_server(self):
+        server = StandInServer(packets)
+
+        async def main():
+            clients = [AsyncClient(CountingSubscriber()) for _ in range(5)]
+            for client in clients:
+                self.assertTrue(await client.connect(server.address, 'tok',
+                                                     timeout=5))
+            names = await asyncio.gather(*(self.collect(c) for c in clients))
+            return clients, names
+
+        try:
+            clients, names = run(main())
+        finally:
+            server.close()
+        for client, client_names in zip(clients, names):
+            self.assertListEqual(['world_update'] * len(packets),
+                                 client_names)
+            self.assertFalse(client.connected)
+            self.assertTrue(client.subscriber.closed)
+            self.assertEqual(190, client.world.cells[1].pos.x)
+        for received in server.received:
+            self.assertGreaterEqual(len(received), 3)  # handshake, token
+            self.assertEqual(b'tok', received[2][1:])
+
+    async def collect(self, client):
+        return [name async for name in client]
+
+    def test_transport(self):
+        transport = QueueTransport()
+
+        async def open_transport(address, origin):
+            self.assertEqual('local:1', address)
+            return transport
+
+        async def main():
+            client = AsyncClient(CountingSubscriber(), open_transport)
+            self.assertFalse(client.connected)
+            self.assertTrue(await client.connect('local:1'))
+            self.assertFalse(await client.connect('local:1'))  # already
+            self.assertEqual(1, len(client.subscriber.errors))
+            client.send_split()
+            for packet in packets[:3]:
+                transport.queue.put_nowait(packet)
+            transport.queue.put_nowait(None)
+            await client.listen()
+            return client
+
+        client = run(main())
+        self.assertEqual(3, client.subscriber.updates)
+        self.assertFalse(client.connected)
+        self.assertEqual(3, len(transport.sent))  # handshake, split
+
+    def test_unconnected(self):
+        client = AsyncClient(CountingSubscriber())
+        self.assertIsInstance(client.transport, UnconnectedTransport)
+        self.assertFalse(client.connected)
+        client.send_split()  # not sent
+        client.disconnect()
+        self.assertTrue(client.subscriber.closed)
+
+    def test_connect_error(self):
+        async def refuse(address, origin):
+            raise ConnectionRefusedError('refused')
+
+        client = AsyncClient(CountingSubscriber(), refuse)
+        self.assertFalse(run(client.connect('local:1')))
+        self.assertEqual(1, len(client.subscriber.errors))
@@ -0,0 +1,81 @@
+import struct
+import sys
+from unittest import TestCase
+
+from agarnet.buffer import BufferStruct, BufferUnderflowError, StringCache
+
+
+class BufferStructTest(TestCase):
+    def test_pop_values(self):
+        msg = struct.pack('<BhIfd', 42, -3, 123456, 1.5, -2.25)
+        buf = BufferStruct(msg)
+        self.assertEqual(len(msg), buf.remaining)
+        self.assertEqual(42, buf.pop_uint8())
+        self.assertEqual(-3, buf.pop_int16())
+        self.assertEqual(123456, buf.pop_uint32())
+        self.assertEqual(1.5, buf.pop_float32())
+        self.assertEqual(-2.25, buf.pop_float64())
+        self.assertEqual(0, buf.remaining)
+        self.assertEqual(b'', bytes(buf.buffer))
+
+    def test_no_copy(self):
+        msg = bytearray(struct.pack('<II', 1, 2))
+        buf = BufferStruct(msg)
+        buf.pop_uint32()
+        msg[4] = 7  # the buffer is a view on the message
+        self.assertEqual(7, buf.pop_uint32())
+
+    def test_skip(self):
+        buf = BufferStruct(struct.pack('<IH', 1, 2))
+        buf.skip(4)
+        self.assertEqual(2, buf.pop_uint16())
+        self.assertRaises(BufferUnderflowError, buf.skip, 1)
+
+    def test_underflow(self):
+        buf = BufferStruct(b'\x01\x02')
+        with self.assertRaises(BufferUnderflowError) as cm:
+            buf.pop_uint32()
+        self.assertEqual(b'\x01\x02', cm.exception.buf)
+        self.assertEqual(2, buf.remaining)  # nothing was consumed
+
+    def test_pop_str16(self):
+        name = 'aĀ\U0001F600z'  # includes a surrogate pair
+        msg = name.encode('utf-16-le') + b'\0\0' + b'\x00\x01\0\0'
+        buf = BufferStruct(msg)
+        self.assertEqual(name, buf.pop_str16())
+        # terminator has to be aligned to 2 bytes
+        self.assertEqual('Ā', buf.pop_str16())
+        self.assertEqual(0, buf.remaining)
+        self.assertRaises(BufferUnderflowError,
+                          BufferStruct(b'a\0b\0').pop_str16)
+
+    def test_pop_str16_lone_surrogate(self):
+        buf = BufferStruct(b'a\0\x00\xd8\0\0')
+        lone = '\ud800' if sys.version_info >= (3, 4) else '\ufffd'
+        self.assertEqual('a' + lone, buf.pop_str16())
+
+    def test_pop_str8(self):
+        buf = BufferStruct('skin/ä'.encode() + b'\0\0')
+        self.assertEqual('skin/ä', buf.pop_str8())
+        self.assertEqual('', buf.pop_str8())
+        self.assertRaises(BufferUnderflowError, buf.pop_str8)
+
+
+class StringCacheTest(TestCase):
+    def test_cache(self):
+        cache = StringCache(maxsize=2)
+        msg = 'foo'.encode('utf-16-le') + b'\0\0'
+        first = BufferStruct(msg, cache).pop_str16()
+        second = BufferStruct(bytearray(msg), cache).pop_str16()
+        self.assertEqual('foo', first)
+        self.assertIs(first, second)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+        # same bytes, different encoding
+        self.assertEqual('f', cache.decode(b'f\0', 'utf-8', 'replace')[0])
+        self.assertEqual(2, cache.misses)
+
+        cache.decode(b'bar', 'utf-8')  # evicts the least recently used
+        self.assertEqual(2, len(cache))
+        cache.decode(b'f\0o\0o\0', 'utf-16-le')
+        self.assertEqual(4, cache.misses)
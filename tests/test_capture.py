@@ -0,0 +1,103 @@
+import io
+import unittest
+
+from agarnet.capture import CaptureError, CaptureReader, CaptureWriter, \
+    RECEIVED, SENT
+from agarnet.client import Client
+from agarnet.transport import MemoryTransport
+
+from .test_pool import CountingSubscriber, packets
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        self.now += 0.5
+        return self.now
+
+
+class CaptureTest(unittest.TestCase):
+    def check_roundtrip(self, compress):
+        f = io.BytesIO()
+        writer = CaptureWriter(f, compress=compress, block_size=1000,
+                               clock=FakeClock())
+        writer.record(SENT, b'\xff')
+        for packet in packets:
+            writer.record_received(packet)
+        writer.record(SENT, b'')
+        writer.close()
+        self.assertFalse(f.closed)  # not opened by the writer
+        self.assertEqual(len(packets) + 2, writer.records)
+
+        f.seek(0)
+        reader = CaptureReader(f)
+        self.assertEqual(compress, reader.compressed)
+        records = list(reader)
+        self.assertEqual(len(packets) + 2, len(records))
+        self.assertEqual((0.5, SENT, b'\xff'), records[0])
+        self.assertEqual((SENT, b''), records[-1][1:])
+        self.assertEqual([0.5 * (i + 1) for i in range(len(records))],
+                         [r.time for r in records])
+        f.seek(0)
+        self.assertEqual(packets, list(CaptureReader(f).packets()))
+        return f.getvalue()
+
+    def test_roundtrip(self):
+        raw = self.check_roundtrip(compress=False)
+        compressed = self.check_roundtrip(compress=True)
+        self.assertLess(len(compressed), len(raw))
+
+    def test_buffered(self):
+        f = io.BytesIO()
+        writer = CaptureWriter(f, block_size=1 << 20)
+        header_size = len(f.getvalue())
+        writer.record_received(packets[0])
+        self.assertEqual(header_size, len(f.getvalue()))  # not written yet
+        writer.flush()
+        self.assertGreater(len(f.getvalue()), header_size)
+
+    def test_truncated(self):
+        for compress in (False, True):
+            f = io.BytesIO()
+            with CaptureWriter(f, compress=compress, block_size=1) as writer:
+                for packet in packets[:3]:
+                    writer.record_received(packet)
+            data = f.getvalue()[:-3]
+            packets_read = list(CaptureReader(io.BytesIO(data)).packets())
+            self.assertEqual(packets[:2], packets_read)
+
+    def test_invalid(self):
+        with self.assertRaises(CaptureError):
+            CaptureReader(io.BytesIO(b'AGC'))
+        with self.assertRaises(CaptureError):
+            CaptureReader(io.BytesIO(b'NOCAP' + bytes(10)))
+
+    def test_client(self):
+        f = io.BytesIO()
+        client = Client(CountingSubscriber(), MemoryTransport(packets))
+        client.recorder = CaptureWriter(f)
+        client.connect('1.2.3.4:5', 'token')  # not recorded
+        client.record_sent = True
+        client.send_spectate()
+        while client.transport.pending():
+            client.on_message()
+        client.recorder.flush()
+
+        f.seek(0)
+        records = list(CaptureReader(f))
+        self.assertEqual(SENT, records[0].direction)
+        self.assertEqual(client.transport.sent[-1], records[0].packet)
+        self.assertEqual([RECEIVED] * len(packets),
+                         [r.direction for r in records[1:]])
+
+        # replaying gives the same world
+        f.seek(0)
+        replay = Client(CountingSubscriber(),
+                        MemoryTransport(CaptureReader(f).packets()))
+        replay.connect('1.2.3.4:5')
+        while replay.transport.pending():
+            replay.on_message()
+        self.assertEqual(len(packets), replay.subscriber.updates)
+        self.assertEqual(190, replay.world.cells[1].pos.x)
@@ -4,28 +4,7 @@ import unittest
 from agarnet.client import Client
 from agarnet.utils import find_server
 
-
-class SubscriberMock(object):
-    def __init__(self):
-        self.events = []
-        self.data = []
-
-    def reset(self):
-        self.events.clear()
-        self.data.clear()
-
-    def __getattr__(self, item):
-        assert item[:3] == 'on_', \
-            'Requested non-event handler %s from subscriber' % item
-        if 'error' in item:
-            def error_handler(error):
-                raise AssertionError('Error event "%s": %s' % (item, error))
-            return error_handler
-        event = item[3:]
-        data = {}
-        self.events.append(event)
-        self.data.append(data)
-        return lambda **d: data.update(d)
+from .test_protocol import SubscriberMock
 
 
 class ClientTest(unittest.TestCase):
@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from agarnet.columnar import ColumnarWorld, numpy
+from agarnet.protocol import ProtocolParser
+from agarnet.vec import Vec
+from agarnet.world import Player, World
+
+from .test_protocol import NullSubscriber, world_update_packet
+
+
+packets = [
+    world_update_packet(cells=[
+        (1, 10, 20, 30, (255, 0, 51), 0, '', 'Foo'),
+        (2, -5, 7, 10, (0, 0, 0), 1, '', ''),
+        (3, 0, 0, 40, (1, 2, 3), 16, '', 'Bar'),
+        (4, 1, 2, 38, (1, 2, 3), 0, '', ''),
+    ]),
+    world_update_packet(
+        eaten=[(3, 2)], cells=[(1, 11, 21, 31, (255, 0, 51), 0, '', '')],
+        deleted=[1]),
+]
+
+
+class ColumnarWorldTest(TestCase):
+    def check_backend(self, use_numpy):
+        parsers = []
+        for world in (World(), ColumnarWorld(use_numpy)):
+            player = Player()
+            player.world = world
+            parser = ProtocolParser(NullSubscriber(), player)
+            parser.parse(packets[0])
+            parsers.append(parser)
+
+        expected, columnar = (p.world.cells for p in parsers)
+        self.assertSetEqual(set(expected), set(columnar))
+        for cid, cell in expected.items():
+            view = columnar[cid]
+            self.assertEqual(tuple(cell.pos), tuple(view.pos))
+            for attr in ('cid', 'size', 'mass', 'name', 'color', 'is_virus',
+                         'is_agitated', 'is_food', 'is_ejected_mass'):
+                self.assertEqual(getattr(cell, attr), getattr(view, attr))
+        self.assertTrue(columnar[2] < columnar[1])
+        self.assertTrue(columnar[1].same_player(columnar[1]))
+
+        for parser in parsers:
+            parser.parse(packets[1])
+        self.assertSetEqual({3, 4}, set(columnar))
+        self.assertListEqual([4, 3], sorted(columnar, reverse=True))
+        self.assertEqual(['Bar', ''], [columnar[c].name
+                                       for c in columnar.column('cid')])
+        self.assertListEqual([40, 38], list(columnar.column('size')))
+
+        columnar[3].pos = Vec(5, 6)
+        self.assertEqual((5, 6), tuple(columnar[3].pos))
+
+        parsers[1].world.reset()
+        self.assertEqual(0, len(columnar))
+
+    def test_array_backend(self):
+        self.check_backend(use_numpy=False)
+
+    def test_numpy_backend(self):
+        if numpy is None:
+            self.skipTest('NumPy not installed')
+        self.check_backend(use_numpy=True)
+
+    def test_grow(self):
+        world = ColumnarWorld()
+        world.cells.capacity = 2
+        world.reset()
+        for cid in range(1, 10):
+            world.update_cell(cid, cid, 0, 10, '', (0, 0, 0), False, False)
+        for cid in range(1, 10, 2):
+            world.remove_cell(cid)
+        self.assertSetEqual(set(range(2, 10, 2)),
+                            set(world.cells.column('cid')))
+        self.assertSetEqual(set(range(2, 10, 2)),
+                            set(world.cells.column('x')))
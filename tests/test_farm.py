@@ -0,0 +1,57 @@
+import time
+import unittest
+
+from agarnet.farm import Farm
+
+from .server import StandInServer
+from .test_pool import CountingSubscriber, packets
+
+
+class FarmTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(packets)
+
+    def tearDown(self):
+        self.server.close()
+
+    def wait_for(self, farm, condition, timeout=10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            farm.poll(0.05)
+            if condition(farm.stats):
+                return farm.stats
+        self.fail('Timed out, stats: %s' % farm.stats)
+
+    def test_farm(self):
+        with Farm(CountingSubscriber, 2, report_interval=0.05) as farm:
+            workers = [farm.add_client(self.server.address)
+                       for _ in range(6)]
+            self.assertEqual(3, workers.count(0))  # no stats yet
+            stats = self.wait_for(farm, lambda s: s['dead'] == 6)
+            # the measured loads depend on timing, so replace them
+            farm.workers[0].parse_load = 0.5  # busier than worker 1
+            farm.workers[1].parse_load = 0.0
+            self.assertEqual(1, farm.add_client(self.server.address))
+            self.assertEqual(1, farm.add_client(self.server.address))
+            farm.workers[1].parse_load = 0.6
+            self.assertEqual(0, farm.add_client(self.server.address))
+        self.assertEqual(6, stats['clients'])
+        self.assertEqual(0, stats['alive'])
+        self.assertEqual(6 * len(packets), stats['packets'])
+        self.assertGreater(stats['parse_us'], 0)
+        self.assertEqual(0, stats['restarts'])
+        self.assertGreaterEqual(len(self.server.received), 6)
+
+    def test_restart(self):
+        with Farm(CountingSubscriber, 2, report_interval=0.05) as farm:
+            for _ in range(4):
+                farm.add_client(self.server.address)
+            self.wait_for(farm, lambda s: s['dead'] == 4)
+            farm.workers[0].process.terminate()
+            farm.workers[0].process.join()
+            # the restarted worker reconnects its 2 clients
+            stats = self.wait_for(farm, lambda s: s['restarts'] == 1 and
+                                  s['dead'] == 4)
+            self.assertTrue(farm.workers[0].process.is_alive())
+        self.assertEqual(6, len(self.server.received))
+        self.assertEqual(4, stats['clients'])
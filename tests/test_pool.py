@@ -0,0 +1,131 @@
+import threading
+import unittest
+
+from agarnet.client import Client
+from agarnet.pool import ClientPool, SelectSelector
+
+from .server import StandInServer, encode_frame
+from .test_protocol import NullSubscriber, world_update_packet
+
+
+packets = [world_update_packet(cells=[
+    (cid, tick * 10, cid, 30, (255, 0, 51), 0, '', 'Foo')
+    for cid in range(1, 51)]) for tick in range(20)]
+
+
+class CountingSubscriber(NullSubscriber):
+    def __init__(self):
+        self.updates = 0
+        self.closed = False
+        self.errors = []
+
+    def on_world_update_post(self):
+        self.updates += 1
+
+    def on_message_error(self, msg):
+        self.errors.append(msg)
+
+    def on_connect_error(self, msg):
+        self.errors.append(msg)
+
+    def on_sock_closed(self):
+        self.closed = True
+
+
+class SplitFrameServer(StandInServer):
+    """
+    Sends the first half of the frames, and the rest once `resume` is set.
+    """
+
+    def __init__(self, packets):
+        self.resume = threading.Event()
+        super(SplitFrameServer, self).__init__(packets)
+
+    def send_packets(self, conn):
+        data = b''.join(map(encode_frame, self.packets))
+        conn.sendall(data[:len(data) // 2])
+        self.resume.wait(10)
+        conn.sendall(data[len(data) // 2:])
+
+
+class ClientPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(packets)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_run(self):
+        pool = ClientPool()
+        clients = [Client(CountingSubscriber()) for _ in range(5)]
+        for client in clients:
+            self.assertTrue(client.connect(self.server.address))
+            pool.add(client)
+        self.assertEqual(5, len(pool))
+
+        pool.run(timeout=5)
+
+        self.assertEqual(0, len(pool))
+        for client in clients:
+            self.assertFalse(client.connected)
+            self.assertTrue(client.subscriber.closed)
+            self.assertEqual(len(packets), client.subscriber.updates)
+            self.assertEqual(1, len(client.subscriber.errors))  # closed
+            self.assertEqual(190, client.world.cells[1].pos.x)
+        self.assertEqual(5 * len(packets), pool.total.packets)
+        self.assertEqual(5 * sum(map(len, packets)), pool.total.bytes)
+        self.assertGreater(pool.total.parse_time, 0)
+        self.assertGreater(pool.total.packets_per_second, 0)
+        for received in self.server.received:
+            self.assertEqual(2, len(received))  # the handshake packets
+
+    def test_select_selector(self):
+        pool = ClientPool(SelectSelector())
+        clients = [Client(CountingSubscriber()) for _ in range(3)]
+        for client in clients:
+            client.connect(self.server.address)
+            pool.add(client)
+        pool.run(timeout=5)
+        self.assertEqual(0, len(pool))
+        for client in clients:
+            self.assertEqual(len(packets), client.subscriber.updates)
+
+    def test_stats(self):
+        pool = ClientPool()
+        client = Client(CountingSubscriber())
+        client.connect(self.server.address)
+        pool.add(client)
+        stats = pool.stats[client]
+        while stats.packets < 3:
+            pool.poll(5)
+        # all packets read at once are parsed in the same poll
+        self.assertEqual(sum(map(len, packets[:stats.packets])), stats.bytes)
+        pool.remove(client)
+        self.assertNotIn(client, pool)
+        client.disconnect()
+
+    def test_partial_frame(self):
+        slow_server = SplitFrameServer(packets[:1])
+        try:
+            pool = ClientPool()
+            waiting = Client(CountingSubscriber())
+            waiting.connect(slow_server.address)
+            pool.add(waiting)
+            other = Client(CountingSubscriber())
+            other.connect(self.server.address)
+            pool.add(other)
+
+            # half a frame does not block the other client
+            while other in pool:
+                pool.poll(5)
+            self.assertEqual(len(packets), other.subscriber.updates)
+            self.assertIn(waiting, pool)
+            self.assertEqual(0, waiting.subscriber.updates)
+
+            slow_server.resume.set()
+            pool.run(timeout=5)
+            self.assertEqual(1, waiting.subscriber.updates)
+            self.assertEqual(1, len(waiting.subscriber.errors))  # closed
+        finally:
+            slow_server.resume.set()
+            slow_server.close()
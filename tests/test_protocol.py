@@ -0,0 +1,225 @@
+import struct
+import subprocess
+import sys
+import unittest
+
+from agarnet.protocol import ProtocolEncoder, ProtocolParser
+from agarnet.vec import Vec
+from agarnet.world import EvictionPolicy
+
+
+class SubscriberMock(object):
+    def __init__(self):
+        self.events = []
+        self.data = []
+
+    def reset(self):
+        self.events.clear()
+        self.data.clear()
+
+    def __getattr__(self, item):
+        assert item[:3] == 'on_', \
+            'Requested non-event handler %s from subscriber' % item
+        if 'error' in item:
+            def error_handler(error):
+                raise AssertionError('Error event "%s": %s' % (item, error))
+            return error_handler
+        event = item[3:]
+        data = {}
+        self.events.append(event)
+        self.data.append(data)
+        return lambda **d: data.update(d)
+
+
+class NullSubscriber(object):
+    def __getattr__(self, item):
+        return lambda **d: None
+
+
+def world_update_packet(eaten=(), cells=(), deleted=()):
+    """
+    Builds a `world_update` packet.
+
+    `cells` contains `(cid, x, y, size, color, flags, skin, name)` tuples.
+    """
+    parts = [struct.pack('<BH', 16, len(eaten))]
+    for eater, eaten_id in eaten:
+        parts.append(struct.pack('<II', eater, eaten_id))
+    for cid, x, y, size, color, flags, skin, name in cells:
+        parts.append(struct.pack('<IiihBBBB', cid, x, y, size,
+                                 *(color + (flags,))))
+        if flags & 2:
+            parts.append(struct.pack('<I', 3) + b'pad')
+        if flags & 4:
+            parts.append(skin.encode() + b'\0')
+        parts.append(name.encode('utf-16-le') + b'\0\0')
+    parts.append(struct.pack('<I', 0))
+    parts.append(struct.pack('<I%iI' % len(deleted), len(deleted), *deleted))
+    return b''.join(parts)
+
+
+class ParseTest(unittest.TestCase):
+    def test_world_update(self):
+        parser = ProtocolParser(NullSubscriber())
+        parser.parse(world_update_packet(cells=[
+            (1, 10, 20, 30, (255, 0, 51), 0, '', 'Foo'),
+            (2, -5, 7, 10, (0, 0, 0), 1 | 2, '', ''),
+            (3, 0, 0, 40, (1, 2, 3), 4 | 16, 'skin', 'Bar'),
+        ]))
+        cells = parser.world.cells
+        self.assertSetEqual({1, 2, 3}, set(cells))
+        self.assertEqual((10, 20), tuple(cells[1].pos))
+        self.assertEqual(30, cells[1].size)
+        self.assertEqual(9.0, cells[1].mass)
+        self.assertEqual('Foo', cells[1].name)
+        self.assertEqual((1.0, 0.0, 0.2), cells[1].color)
+        self.assertTrue(cells[2].is_virus)
+        self.assertTrue(cells[2].is_food)
+        self.assertTrue(cells[3].is_agitated)
+        self.assertEqual('Bar', cells[3].name)
+
+        parser.parse(world_update_packet(
+            eaten=[(1, 2)], cells=[(1, 11, 21, 31, (255, 0, 51), 0, '', '')],
+            deleted=[3, 4]))
+        self.assertSetEqual({1}, set(cells))
+        self.assertEqual((11, 21), tuple(cells[1].pos))
+        self.assertEqual('Foo', cells[1].name)
+
+    def test_eaten_own_cells(self):
+        subscriber = SubscriberMock()
+        parser = ProtocolParser(subscriber)
+        parser.parse(world_update_packet(cells=[
+            (1, 0, 0, 30, (0, 0, 0), 0, '', ''),
+            (2, 0, 0, 30, (0, 0, 0), 0, '', ''),
+            (3, 0, 0, 90, (0, 0, 0), 0, '', ''),
+        ]))
+        parser.player.own_ids.update((1, 2))
+
+        subscriber.reset()
+        parser.parse(world_update_packet(eaten=[(3, 1)]))
+        self.assertSetEqual({2}, parser.player.own_ids)
+        self.assertNotIn('death', subscriber.events)
+
+        subscriber.reset()
+        parser.parse(world_update_packet(eaten=[(3, 2)]))
+        self.assertSetEqual(set(), parser.player.own_ids)
+        self.assertIn('death', subscriber.events)
+        self.assertSetEqual({3}, set(parser.world.cells))
+
+    def test_removal_order(self):
+        subscriber = SubscriberMock()
+        parser = ProtocolParser(subscriber)
+        parser.parse(world_update_packet(cells=[
+            (cid, 0, 0, 30, (0, 0, 0), 0, '', '') for cid in range(1, 40)]))
+        subscriber.reset()
+        parser.parse(world_update_packet(eaten=[(1, 9), (1, 2)],
+                                         deleted=[33, 5, 17, 8]))
+        events = [(e, d.get('cid', d.get('eaten_id')))
+                  for e, d in zip(subscriber.events, subscriber.data)
+                  if e in ('cell_eaten', 'cell_removed')]
+        self.assertListEqual([
+            ('cell_eaten', 9), ('cell_removed', 9),
+            ('cell_eaten', 2), ('cell_removed', 2),
+            ('cell_removed', 33), ('cell_removed', 5),
+            ('cell_removed', 17), ('cell_removed', 8),
+        ], events)
+
+    def test_subscribed_events(self):
+        class DeathSubscriber(object):
+            subscribed_events = ('death',)
+
+            def __init__(self):
+                self.deaths = 0
+
+            def on_death(self):
+                self.deaths += 1
+
+        subscriber = DeathSubscriber()
+        parser = ProtocolParser(subscriber)
+        self.assertFalse(parser.subscribes('cell_info'))
+        parser.parse(world_update_packet(cells=[
+            (1, 0, 0, 30, (0, 0, 0), 4, 'skin', 'Foo'),
+            (2, 0, 0, 90, (0, 0, 0), 0, '', ''),
+        ]))
+        parser.player.own_ids.add(1)
+        parser.parse(world_update_packet(eaten=[(2, 1)], deleted=[2]))
+        self.assertEqual(1, subscriber.deaths)
+        self.assertSetEqual(set(), set(parser.world.cells))
+
+    def test_world_update_batch(self):
+        class BatchSubscriber(object):
+            subscribed_events = ('world_update_batch',)
+            batches = []
+
+            def on_world_update_batch(self, **batch):
+                self.batches.append(batch)
+
+        subscriber = BatchSubscriber()
+        parser = ProtocolParser(subscriber)
+        parser.parse(world_update_packet(
+            eaten=[(1, 3)],
+            cells=[(1, 10, -20, 30, (0, 0, 0), 0, '', 'Foo'),
+                   (2, 5, 6, 7, (0, 0, 0), 1, '', '')],
+            deleted=[4, 5]))
+        batch, = subscriber.batches
+        self.assertListEqual([1, 3], list(batch['eaten']))
+        self.assertListEqual([1, 2], list(batch['cids']))
+        self.assertListEqual([10, 5], list(batch['xs']))
+        self.assertListEqual([-20, 6], list(batch['ys']))
+        self.assertListEqual([30, 7], list(batch['sizes']))
+        self.assertListEqual([0, 1], list(batch['flags']))
+        self.assertListEqual([4, 5], list(batch['removed']))
+        self.assertSetEqual({1, 2}, set(parser.world.cells))
+
+        # not emitted if not subscribed explicitly
+        self.assertFalse(ProtocolParser(NullSubscriber())
+                         .subscribes('world_update_batch'))
+
+    def test_eviction(self):
+        subscriber = SubscriberMock()
+        parser = ProtocolParser(subscriber)
+        parser.world.eviction = EvictionPolicy(max_age=1)
+        parser.parse(world_update_packet(cells=[
+            (1, 0, 0, 30, (0, 0, 0), 0, '', ''),
+            (2, 0, 0, 30, (0, 0, 0), 0, '', ''),
+        ]))
+        parser.player.own_ids.add(2)
+        for i in range(2):
+            subscriber.reset()
+            parser.parse(world_update_packet())
+        self.assertSetEqual({2}, set(parser.world.cells))
+        self.assertIn('cell_removed', subscriber.events)
+        removed = subscriber.data[subscriber.events.index('cell_removed')]
+        self.assertDictEqual({'cid': 1}, removed)
+
+    def test_indexes_after_own_id(self):
+        parser = ProtocolParser(NullSubscriber())
+        parser.parse(struct.pack('<BI', 32, 7))  # created, not updated yet
+        world = parser.world
+        world.sort_by_mass = True
+        world.eviction = EvictionPolicy()
+        indexes = [world.grid, world.mass_order, world.update_ticks,
+                   world.players]
+        for index in indexes[:3]:
+            self.assertIn(7, index)
+        self.assertEqual([7], [c.cid for c in world.nearest(Vec(0, 0), 3)])
+
+        parser.parse(world_update_packet(deleted=[7]))
+        self.assertEqual([0, 0, 0, 0], [len(index) for index in indexes])
+        self.assertEqual([], world.nearest(Vec(0, 0), 3))
+
+    def test_no_websocket_import(self):
+        code = ('import sys, agarnet.protocol;'
+                'print("websocket" in sys.modules)')
+        out = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(b'False', out.strip())
+
+
+class EncoderTest(unittest.TestCase):
+    def test_packets(self):
+        encoder = ProtocolEncoder()
+        self.assertEqual(b'\x11', encoder.split())
+        self.assertEqual(struct.pack('<BiiI', 16, 1, -2, 0),
+                         encoder.target(1.5, -2.5))
+        self.assertEqual(b'\x00a\x00b\x00', encoder.respawn('ab'))
+        self.assertEqual(2, len(encoder.handshake()))
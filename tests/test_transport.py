@@ -0,0 +1,74 @@
+import unittest
+
+from agarnet.client import Client
+from agarnet.pool import ClientPool
+from agarnet.transport import MemoryTransport, SocketTransport, \
+    WebSocketClientTransport, default_transport
+
+from .server import StandInServer
+from .test_pool import CountingSubscriber, packets
+
+
+class MemoryTransportTest(unittest.TestCase):
+    def test_client(self):
+        transport = MemoryTransport(packets[:2])
+        client = Client(CountingSubscriber(), transport)
+        self.assertFalse(client.connected)
+        self.assertTrue(client.connect('1.2.3.4:5', 'token'))
+        self.assertEqual('ws://1.2.3.4:5', transport.url)
+        self.assertEqual(3, len(transport.sent))  # handshake, token
+        self.assertEqual(b'token', transport.sent[2][1:])
+
+        transport.feed(*packets[2:5])
+        while transport.pending():
+            self.assertEqual('world_update', client.on_message())
+        self.assertEqual(5, client.subscriber.updates)
+        self.assertEqual(40, client.world.cells[1].pos.x)
+
+        self.assertFalse(client.on_message())  # no more packets
+        self.assertFalse(client.connected)
+        self.assertTrue(client.subscriber.closed)
+
+    def test_listen(self):
+        client = Client(CountingSubscriber(), MemoryTransport(packets[:3]))
+        client.connect('1.2.3.4:5')
+        client.listen()  # returns once drained
+        self.assertEqual(3, client.subscriber.updates)
+        self.assertFalse(client.connected)
+        self.assertTrue(client.subscriber.closed)
+
+    def test_default(self):
+        self.assertIsInstance(default_transport(), WebSocketClientTransport)
+        client = Client(CountingSubscriber())
+        self.assertIs(client.transport.ws, client.ws)  # websocket.WebSocket
+        client = Client(CountingSubscriber(), MemoryTransport())
+        with self.assertWarns(DeprecationWarning):
+            self.assertIs(client.transport, client.ws)
+
+
+class SocketTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(packets)
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_listen(self):
+        client = Client(CountingSubscriber(), SocketTransport())
+        self.assertTrue(client.connect(self.server.address, 'token'))
+        client.listen()
+        self.assertEqual(len(packets), client.subscriber.updates)
+        self.assertFalse(client.connected)
+        self.assertEqual(b'token', self.server.received[0][2][1:])
+
+    def test_pool(self):
+        pool = ClientPool()
+        clients = [Client(CountingSubscriber(), SocketTransport())
+                   for _ in range(3)]
+        for client in clients:
+            client.connect(self.server.address)
+            pool.add(client)
+        pool.run(timeout=5)
+        for client in clients:
+            self.assertEqual(len(packets), client.subscriber.updates)
+        self.assertEqual(3 * len(packets), pool.total.packets)
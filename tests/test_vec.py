@@ -0,0 +1,162 @@
+import math
+from array import array
+from unittest import TestCase, skipIf
+
+from agarnet.columnar import ColumnarWorld
+from agarnet.vec import Vec, VecArray, numpy, segment_circle_hits
+
+from .test_world import random_world
+
+
+points = [Vec(3, 4), Vec(-1, 2), Vec(0, 0), Vec(5, -7.5)]
+others = [Vec(1, 1), Vec(2, -3), Vec(-4, 0), Vec(0.5, 6)]
+
+
+class VecArrayTest(TestCase):
+    def check_vecs_almost_equal(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e[0], a[0])
+            self.assertAlmostEqual(e[1], a[1])
+
+    def check_values_almost_equal(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for e, a in zip(expected, actual):
+            self.assertAlmostEqual(e, a)
+
+    def check_backend(self, use_numpy):
+        vecs = VecArray.from_vecs(points, use_numpy)
+        other = VecArray.from_vecs(others, use_numpy)
+        v = Vec(2, 1)
+        self.assertEqual(use_numpy, vecs.use_numpy)
+        self.assertEqual(4, len(vecs))
+        self.check_vecs_almost_equal(points, vecs)
+
+        self.check_vecs_almost_equal([p + o for p, o in zip(points, others)],
+                                     vecs + other)
+        self.check_vecs_almost_equal([p - v for p in points], vecs - v)
+        self.check_vecs_almost_equal([v - p for p in points], (2, 1) - vecs)
+        self.check_vecs_almost_equal([p * 3 for p in points], 3 * vecs)
+        self.check_vecs_almost_equal([p / 2 for p in points], vecs / 2)
+        self.check_vecs_almost_equal([-p for p in points], -vecs)
+        self.check_vecs_almost_equal([p.perp() for p in points], vecs.perp())
+        self.check_vecs_almost_equal([p.rot(1.2) for p in points],
+                                     vecs.rot(1.2))
+        self.check_vecs_almost_equal([p.unit() if p else p for p in points],
+                                     vecs.unit())
+
+        self.check_values_almost_equal(
+            [p.dot(o) for p, o in zip(points, others)], vecs.dot(other))
+        self.check_values_almost_equal([p.cross(v) for p in points],
+                                       vecs.cross(v))
+        self.check_values_almost_equal([p.lensq() for p in points],
+                                       vecs.lensq())
+        self.check_values_almost_equal([p.len() for p in points], vecs.len())
+        self.check_values_almost_equal([p.proj(v) for p in points],
+                                       vecs.proj(v))
+        self.check_values_almost_equal(
+            [p.proj(o) for p, o in zip(points, others)], vecs.proj(other))
+        self.check_values_almost_equal(
+            [p.angle_to(o) for p, o in zip(points, others)],
+            vecs.angle_to(other))
+        self.check_values_almost_equal(
+            [math.atan2(p.y, p.x) for p in points], vecs.angle())
+
+        self.assertRaises(ValueError, VecArray, [1, 2], [3], use_numpy)
+
+    def test_array(self):
+        self.check_backend(False)
+        xs = array('d', [1, 2])
+        self.assertIs(xs, VecArray(xs, array('d', [3, 4]), False).x)
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        self.check_backend(True)
+
+    def test_world_positions(self):
+        world = random_world(50)
+        cids, positions = world.positions()
+        self.check_vecs_almost_equal([world.cells[cid].pos for cid in cids],
+                                     positions)
+
+        for use_numpy in (False, True) if numpy else (False,):
+            world = ColumnarWorld(use_numpy)
+            for cid in range(1, 20):
+                world.update_cell(cid, cid, -cid, 10, '', (0, 0, 0),
+                                  False, False)
+            world.remove_cell(5)
+            cids, positions = world.positions()
+            self.check_vecs_almost_equal(
+                [world.cells[cid].pos for cid in cids], positions)
+            world.cells[7].pos = (70, 80)  # no copy
+            self.assertIn((70, 80), [tuple(p) for p in positions])
+
+
+def reference_hit(start, end, center, radius):
+    """Steps along the segment, returns the approximate hit distance."""
+    direction = end - start
+    length = direction.len()
+    steps = 1000
+    for i in range(steps + 1):
+        pos = start + direction * (i / steps)
+        if (pos - center).len() <= radius:
+            return length * i / steps
+    return float('inf')
+
+
+class SegmentCircleTest(TestCase):
+    def check_backend(self, use_numpy):
+        centers = [Vec(5, 0), Vec(5, 3), Vec(5, 4.1), Vec(-2, 0),
+                   Vec(12, 0), Vec(0, 0), Vec(3, -1)]
+        radii = [1, 3, 4, 1, 1.5, 0.5, 2]
+        start, end = Vec(0, 0), Vec(10, 0)
+        hits = segment_circle_hits(
+            start, end, VecArray.from_vecs(centers, use_numpy), radii)
+        for center, radius, hit in zip(centers, radii, hits):
+            expected = reference_hit(start, end, center, radius)
+            if expected == float('inf'):
+                self.assertEqual(expected, hit)
+            else:
+                self.assertAlmostEqual(expected, hit, delta=0.011)
+
+        hits = segment_circle_hits(
+            start, start, VecArray.from_vecs(centers, use_numpy), radii)
+        self.assertListEqual([0 if (c - start).len() <= r else float('inf')
+                              for c, r in zip(centers, radii)], list(hits))
+
+    def test_array(self):
+        self.check_backend(False)
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_numpy(self):
+        self.check_backend(True)
+
+    def test_world_segment_hits(self):
+        world = random_world()
+        segments = [(Vec(-2000, -2000), Vec(2000, 1500)),
+                    (Vec(100, 100), Vec(100, 100)),
+                    (Vec(9000, 9000), Vec(9500, 9000))]
+
+        def is_big(c):
+            return c.size > 150
+
+        def hit(start, end, cell):
+            return segment_circle_hits(start, end,
+                                       VecArray.from_vecs([cell.pos]),
+                                       [cell.size + 30])[0]
+
+        for pruned in (False, True):
+            world.sort_by_mass = pruned
+            results = world.segment_hits(segments, 30, is_big)
+            for (start, end), result in zip(segments, results):
+                first = min(hit(start, end, c)
+                            for c in world.cells.values() if is_big(c))
+                if first == float('inf'):
+                    self.assertIsNone(result)
+                else:
+                    cell, dist = result
+                    self.assertTrue(is_big(cell))
+                    self.assertAlmostEqual(first, dist)
+                    self.assertAlmostEqual(first, hit(start, end, cell))
+            self.assertIsNotNone(results[0])
+        self.assertIsNone(world.segment_hit(*segments[2]))
@@ -1,7 +1,10 @@
-from unittest import TestCase
+import random
+from unittest import TestCase, skipIf
 
 from agarnet.vec import Vec
-from agarnet.world import Cell, Player, World
+from agarnet.vec import numpy
+from agarnet.world import Cell, EvictionPolicy, PREY, Player, SPLIT_PREY, \
+    SPLIT_THREAT, THREAT, World
 
 
 screen = Vec(1920, 1080)
@@ -27,13 +30,258 @@ class CellTest(TestCase):
         self.assertLess(Cell(1), Cell(2))
         self.assertLess(Cell(2, size=10), Cell(1, size=11))
 
+    def test_update(self):
+        cell = Cell(1, 2, 3, 40, 'Foo', (255, 0, 51))
+        self.assertFalse(hasattr(cell, '__dict__'))
+        self.assertEqual(16.0, cell.mass)
+        self.assertEqual((1.0, 0.0, 0.2), cell.color)
+        self.assertIs(cell.color, Cell(color=(255, 0, 51)).color)
+        self.assertFalse(cell.is_food)
+
+        pos = cell.pos
+        cell.update(1, 5, 6, 10, '', [0, 0, 0])
+        self.assertIs(pos, cell.pos)
+        self.assertEqual((5, 6), tuple(cell.pos))
+        self.assertEqual('Foo', cell.name)  # keeps the name
+        self.assertEqual((0.0, 0.0, 0.0), cell.color)
+        self.assertEqual(1.0, cell.mass)
+        self.assertTrue(cell.same_player(Cell(2, name='Foo', color=(0, 0, 0))))
+
+
+def random_world(n=500, seed=42):
+    rnd = random.Random(seed)
+    world = World()
+    for cid in range(1, n + 1):
+        world.update_cell(cid, rnd.uniform(-3000, 3000),
+                          rnd.uniform(-3000, 3000), rnd.randint(10, 200),
+                          rnd.choice(('', 'A', 'B')), (0, 0, 0),
+                          rnd.random() < .05, False)
+    return world
+
 
 class WorldTest(TestCase):
     def test_world(self):
         World()  # TODO WorldTest
 
+    def test_spatial_queries(self):
+        world = random_world()
+        self.assertIsNone(world._grid)  # not built before the first query
+        self.assertEqual(len(world.cells), len(world.grid))
+        for cid in range(1, 501, 3):  # move some, remove some
+            if cid % 2:
+                world.remove_cell(cid)
+            else:
+                world.update_cell(cid, 0, 0, 10, '', (0, 0, 0), False, False)
+        cells = list(world.cells.values())
+        self.assertEqual(len(cells), len(world.grid))
+
+        tl, br = Vec(-1234, -500), Vec(700, 2100)
+        expected = {c.cid for c in cells
+                    if tl.x <= c.pos.x <= br.x and tl.y <= c.pos.y <= br.y}
+        self.assertSetEqual(expected,
+                            {c.cid for c in world.cells_in_rect(tl, br)})
+        self.assertSetEqual(
+            {c.cid for c in cells},
+            {c.cid for c in world.cells_in_rect(Vec(-1e5, -1e5),
+                                                Vec(1e5, 1e5))})
+
+        pos = Vec(321, -654)
+        expected = {c.cid for c in cells if (c.pos - pos).len() <= 800}
+        self.assertSetEqual(expected,
+                            {c.cid for c in world.cells_within(pos, 800)})
+
+        def by_dist(c):
+            return (c.pos - pos).lensq()
+
+        expected = sorted((c for c in cells if c.name), key=by_dist)[:7]
+        nearest = world.nearest(pos, 7, lambda c: c.name)
+        self.assertListEqual([by_dist(c) for c in expected],
+                             [by_dist(c) for c in nearest])
+
+        world.reset()
+        self.assertEqual([], world.nearest(pos))
+        self.assertEqual(0, len(world.grid))
+
+    def test_categories(self):
+        world = random_world()
+        world.update_cell(1000, 0, 0, 37, '', (0, 0, 0), False, False)
+        world.update_cell(1001, 0, 0, 15, '', (0, 0, 0), False, False)
+        for cid in range(1, 501, 7):
+            world.remove_cell(cid)
+        world.update_cell(2, 0, 0, 15, '', (0, 0, 0), False, False)
+        world.update_cell(1001, 0, 0, 50, '', (0, 0, 0), False, False)
+
+        def ids(predicate):
+            return {c.cid for c in world.cells.values() if predicate(c)}
+
+        self.assertSetEqual(ids(lambda c: c.is_virus), world.viruses)
+        self.assertSetEqual(ids(lambda c: c.is_food and not c.is_virus),
+                            world.food)
+        self.assertSetEqual(ids(lambda c: c.is_ejected_mass and
+                                not c.is_virus), world.ejected)
+        self.assertIn(1000, world.ejected)
+        self.assertSetEqual(set(world.cells) - world.viruses - world.food
+                            - world.ejected, world.player_cells)
+        self.assertIn(1001, world.player_cells)
+
+        world.clear_cells()
+        self.assertEqual((0, 0), (len(world.food), len(world.categories)))
+
+    def test_players(self):
+        world = random_world()
+        self.assertIsNone(world._players)  # not built before the first use
+        self.assertIn(world.players, world.indexes)
+        world.update_cell(1, 0, 0, 50, 'A', (0, 0, 1), False, False)
+        for cid in range(2, 501, 5):
+            world.remove_cell(cid)
+        world.update_cell(1, 0, 0, 60, 'A', (0, 0, 0), False, False)
+
+        cells = [c for c in world.cells.values()
+                 if not (c.is_virus or c.is_food or c.is_ejected_mass)]
+        for cell in cells:
+            same = {c.cid for c in cells if c.same_player(cell)}
+            self.assertSetEqual(
+                same, {c.cid for c in world.cells_of_player(cell)})
+            group = world.players[cell.name, cell.color]
+            self.assertAlmostEqual(sum(world.cells[cid].mass
+                                       for cid in same), group.total_mass)
+        self.assertEqual(len({(c.name, c.color) for c in cells}),
+                         len(world.players))
+        self.assertEqual([], world.cells_of_player(Cell(12345)))
+
+        world.clear_cells()
+        self.assertEqual(0, len(world.players))
+
+    def test_mass_order(self):
+        world = random_world()
+        world.sort_by_mass = True
+        for cid in range(1, 501, 4):
+            world.remove_cell(cid)
+        for cid in range(2, 501, 6):
+            world.update_cell(cid, 0, 0, cid % 150 + 10, '', (0, 0, 0),
+                              False, False)
+        order = world.mass_order
+        cells = sorted(world.cells.values())
+        self.assertEqual(len(cells), len(order))
+        self.assertListEqual([c.cid for c in reversed(cells[-9:])],
+                             order.largest(9))
+
+        mass = cells[123].mass
+        smaller = [c.cid for c in cells if c.mass < mass]
+        self.assertListEqual(smaller, order.smaller_than(mass))
+        self.assertEqual(len(smaller), order.count_smaller(mass))
+        self.assertEqual(len(cells) - 124, order.rank(cells[123].cid))
+        self.assertEqual(0, order.rank(cells[-1].cid))
+
+        world.sort_by_mass = False
+        self.assertIsNone(world.mass_order)
+        self.assertNotIn(order, world.indexes)
+
+    def test_stale_cell_ids(self):
+        world = World()
+        update_ticks = world.update_ticks
+        self.assertNotIn(update_ticks, world.indexes)
+        world.eviction = EvictionPolicy()  # start tracking, no limits
+        self.assertIn(update_ticks, world.indexes)
+
+        def update(*cids):
+            world.next_tick()
+            for cid in cids:
+                world.update_cell(cid, cid * 1000, 0, 10, '', (0, 0, 0),
+                                  False, False)
+
+        update(1, 2, 3, 4, 5)
+        update(2, 3, 4)
+        update(3, 4)
+        self.assertSetEqual(set(), world.stale_cell_ids(zero))
+
+        world.eviction = EvictionPolicy(max_age=1)
+        self.assertSetEqual({1, 5}, world.stale_cell_ids(zero))
+        self.assertSetEqual({5}, world.stale_cell_ids(zero, keep=(1,)))
+
+        world.eviction = EvictionPolicy(max_cells=3)
+        self.assertSetEqual({1, 5}, world.stale_cell_ids(zero))
+        self.assertSetEqual({5, 2}, world.stale_cell_ids(zero, keep=(1,)))
+
+        world.eviction = EvictionPolicy(max_distance=2500)
+        # 4 was updated in this tick
+        self.assertSetEqual({5}, world.stale_cell_ids(zero))
+        self.assertSetEqual({1, 2}, world.stale_cell_ids(Vec(5000, 0)))
+
+        world.eviction = None
+        self.assertNotIn(update_ticks, world.indexes)
+        self.assertEqual(0, len(update_ticks))
+        world.eviction = EvictionPolicy(max_age=0)
+        self.assertEqual(len(world.cells), len(update_ticks))
+        self.assertSetEqual(set(), world.stale_cell_ids(zero))
+
+    def test_cell_pool(self):
+        class CustomCell(Cell):
+            pass
+
+        world = World()
+        world.pool_size = 2
+        for cid in (1, 2, 3):
+            world.update_cell(cid, cid, cid, 10, 'Foo', (1, 2, 3), True, True)
+        for cid in (1, 2, 3):
+            world.remove_cell(cid)
+        self.assertEqual(2, len(world.pool))
+        self.assertEqual(0, len(world.grid))
+
+        pooled = set(map(id, world.pool))
+        world.update_cell(4, 5, 6, 20, '', (0, 0, 0), False, False)
+        cell = world.cells[4]
+        self.assertIn(id(cell), pooled)
+        self.assertEqual('', cell.name)  # no leftovers from the old cell
+        self.assertFalse(cell.is_virus)
+        self.assertEqual((5, 6), tuple(cell.pos))
+        self.assertEqual((3, 1), (world.cells_created, world.cells_reused))
+
+        world.cell_class = CustomCell
+        world.create_cell(5)
+        self.assertIs(CustomCell, type(world.cells[5]))
+        self.assertEqual([], world.pool)
+
 
 class PlayerTest(TestCase):
+    def check_own_stats(self, player):
+        cells = list(player.own_cells)
+        self.assertEqual(sum(c.size for c in cells), player.total_size)
+        self.assertAlmostEqual(sum(c.mass for c in cells), player.total_mass)
+        xs = [c.pos.x for c in cells]
+        ys = [c.pos.y for c in cells]
+        self.assertEqual((min(xs) + max(xs)) / 2, player.center.x)
+        self.assertEqual((min(ys) + max(ys)) / 2, player.center.y)
+
+    def test_cells_changed(self):
+        player = Player()
+        player.world = world = random_world()
+        center = player.center
+        player.own_ids.update((1, 2, 3, 4))
+        player.cells_changed()
+        self.check_own_stats(player)
+
+        rnd = random.Random(1)
+        for i in range(50):
+            cid = rnd.choice((1, 2, 3, 4, 5))
+            world.update_cell(cid, rnd.randint(-100, 100),
+                              rnd.randint(-100, 100), rnd.randint(10, 90),
+                              '', (0, 0, 0), False, False)
+            player.cells_changed()
+            self.check_own_stats(player)
+
+        player.own_ids.add(5)
+        world.remove_cell(1)
+        player.own_ids.discard(1)
+        player.cells_changed()
+        self.check_own_stats(player)
+        self.assertIs(center, player.center)  # updated in place
+
+        player.own_ids.clear()
+        player.cells_changed()
+        self.assertEqual(0, player.total_size)
+        self.assertEqual(1.0, player.scale)
+
     def test_visible_area(self):
         player = Player()
 
@@ -72,3 +320,51 @@ class PlayerTest(TestCase):
         self.assertAlmostEqual(ptl.y, rtl.y)
         self.assertAlmostEqual(pbr.x, rbr.x)
         self.assertAlmostEqual(pbr.y, rbr.y)
+
+    def check_classify_cells(self, use_numpy):
+        player = Player()
+        world = player.world = random_world(300)
+        world.update_cell(1000, 0, 0, 100, 'Me', (0, 0, 0), False, False)
+        world.update_cell(1001, 1500, 0, 40, 'Me', (0, 0, 0), False, False)
+        player.own_ids.update((1000, 1001))
+        player.cells_changed()
+
+        cids, flags, distances = player.classify_cells(use_numpy=use_numpy)
+        self.assertSetEqual(world.player_cells - {1000, 1001}, set(cids))
+        self.assertEqual(len(cids), len(flags))
+        own = list(player.own_cells)
+        for cid, flag, dist in zip(cids, flags, distances):
+            cell = world.cells[cid]
+            self.assertAlmostEqual(min((cell.pos - o.pos).len()
+                                       for o in own), dist)
+            self.assertEqual(
+                any(cell.mass >= 1.25 * o.mass for o in own),
+                bool(flag & THREAT))
+            self.assertEqual(
+                any(o.mass >= 1.25 * cell.mass for o in own),
+                bool(flag & PREY))
+            self.assertEqual(
+                any(cell.mass / 2 >= 1.25 * o.mass and
+                    (cell.pos - o.pos).len() - cell.size <= 700
+                    for o in own), bool(flag & SPLIT_THREAT))
+            self.assertEqual(
+                any(o.mass / 2 >= 1.25 * cell.mass and
+                    (cell.pos - o.pos).len() - o.size <= 700
+                    for o in own), bool(flag & SPLIT_PREY))
+        self.assertTrue(any(f & SPLIT_PREY for f in flags))
+        self.assertTrue(any(f & SPLIT_THREAT for f in flags))
+
+        cids, flags, distances = player.classify_cells(
+            [1], eat_ratio=100, split_distance=0, use_numpy=use_numpy)
+        self.assertEqual([0], list(flags))
+
+        player.own_ids.clear()
+        cids, flags, distances = player.classify_cells(use_numpy=use_numpy)
+        self.assertFalse(any(flags))
+
+    def test_classify_cells(self):
+        self.check_classify_cells(False)
+
+    @skipIf(numpy is None, 'NumPy is not installed')
+    def test_classify_cells_numpy(self):
+        self.check_classify_cells(True)
@@ -0,0 +1,58 @@
+import unittest
+
+from agarnet.wsframe import FrameDecoder, HandshakeError, OPCODE_BINARY, \
+    OPCODE_CONTINUATION, OPCODE_PING, OPCODE_TEXT, accept_key, \
+    check_handshake_response, encode_frame, handshake_request
+
+from .server import recv_frame
+
+
+class SocketMock(object):
+    def __init__(self, data):
+        self.data = data
+
+    def recv(self, n):
+        chunk, self.data = self.data[:n], self.data[n:]
+        return chunk
+
+
+class WsFrameTest(unittest.TestCase):
+    def test_handshake(self):
+        request, key = handshake_request('1.2.3.4:5', origin='http://agar.io')
+        self.assertIn(b'Sec-WebSocket-Key: ' + key + b'\r\n', request)
+        self.assertTrue(request.endswith(b'Origin: http://agar.io\r\n\r\n'))
+        # example from RFC 6455
+        self.assertEqual(b's3pPLMBiTxaQ9kYGzzhZRbK+xOo=',
+                         accept_key(b'dGhlIHNhbXBsZSBub25jZQ=='))
+
+        response = b'HTTP/1.1 101 Switching Protocols\r\n' \
+                   b'Sec-WebSocket-Accept: ' + accept_key(key) + b'\r\n\r\n'
+        check_handshake_response(response, key)
+        self.assertRaises(HandshakeError, check_handshake_response,
+                          response, b'other key')
+        self.assertRaises(HandshakeError, check_handshake_response,
+                          b'HTTP/1.1 403 Forbidden\r\n\r\n', key)
+
+    def test_encode(self):
+        for size in (0, 5, 125, 126, 70000):
+            payload = bytes(range(256)) * (size // 256) + bytes(size % 256)
+            frame = encode_frame(payload)
+            self.assertEqual((OPCODE_BINARY, payload),
+                             recv_frame(SocketMock(frame)))
+
+    def test_decode(self):
+        frames = encode_frame(b'abc', mask_key=b'') \
+            + encode_frame(b'x' * 300, OPCODE_PING) \
+            + bytes([OPCODE_TEXT, 2]) + b'he' \
+            + encode_frame(b'llo', OPCODE_CONTINUATION)
+        decoder = FrameDecoder()
+        messages = []
+        for i in range(len(frames)):  # feed byte by byte
+            decoder.feed(frames[i:i + 1])
+            message = decoder.next_message()
+            if message:
+                messages.append(message)
+        self.assertListEqual([(OPCODE_BINARY, b'abc'),
+                              (OPCODE_PING, b'x' * 300),
+                              (OPCODE_TEXT, b'hello')], messages)
+        self.assertIsNone(decoder.next_message())